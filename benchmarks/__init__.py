@@ -0,0 +1 @@
+# Benchmarks and load generator for the paralympics app, see run.py
@@ -0,0 +1,79 @@
+# Compares benchmark results with a baseline and reports the measurements that are worse by more than a threshold
+#
+# python -m benchmarks.compare benchmark_results.json benchmarks/baseline.json --threshold 0.2
+import argparse
+import json
+import sys
+
+# Measurements where a smaller value is better; for throughput a larger value is better. Other values, such as the
+# number of requests, are not compared.
+LOWER_IS_BETTER = ("_ms", "_seconds")
+HIGHER_IS_BETTER = ("_rps",)
+
+
+def flatten(results, prefix=""):
+    """Returns the numbers in nested result dictionaries keyed by their path, e.g. 'sizes.1000.seed_seconds'."""
+    values = {}
+    for key, value in results.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            values.update(flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[path] = value
+    return values
+
+
+def compare(results, baseline, threshold=0.2):
+    """Returns the measurements that are worse than the baseline by more than the threshold.
+
+    Measurements that are only in one of the results are ignored.
+
+    :param results: dictionary of results from benchmarks.run
+    :param baseline: dictionary of results to compare with
+    :param threshold: largest allowed change as a fraction, e.g. 0.2 for 20% slower or 20% less throughput
+    :return: list of (path, baseline value, new value, change as a fraction, worse is positive)
+    """
+    new_values = flatten(results.get("sizes", {}), "sizes.")
+    old_values = flatten(baseline.get("sizes", {}), "sizes.")
+    regressions = []
+    for path in sorted(new_values.keys() & old_values.keys()):
+        old, new = old_values[path], new_values[path]
+        if old <= 0:
+            continue
+        if path.endswith(LOWER_IS_BETTER):
+            change = (new - old) / old
+        elif path.endswith(HIGHER_IS_BETTER):
+            change = (old - new) / old
+        else:
+            continue
+        if change > threshold:
+            regressions.append((path, old, new, change))
+    return regressions
+
+
+def report(regressions, threshold):
+    """Prints the regressions and returns the exit code for the command line, 1 if there are any."""
+    if not regressions:
+        print(f"No measurements are more than {threshold:.0%} worse than the baseline")
+        return 0
+    print(f"{len(regressions)} measurements are more than {threshold:.0%} worse than the baseline:")
+    for path, old, new, change in regressions:
+        print(f"  {path}: {old:.4g} -> {new:.4g} ({change:+.0%} worse)")
+    return 1
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare benchmark results with a baseline")
+    parser.add_argument("results", help="JSON file written by benchmarks.run")
+    parser.add_argument("baseline", help="JSON file to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed change, e.g. 0.2 for 20%%")
+    args = parser.parse_args()
+    with open(args.results) as f:
+        results = json.load(f)
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    sys.exit(report(compare(results, baseline, args.threshold), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
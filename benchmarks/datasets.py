@@ -0,0 +1,89 @@
+# Synthetic region and event data for the benchmarks
+#
+# The files have the same columns as data/noc_regions.csv and data/paralympic_events.csv and are made by repeating the
+# real rows with changed keys, so the values have realistic sizes and the database loaders, indexes and routes do the
+# same work as for the real data, only with more rows.
+import csv
+from pathlib import Path
+
+from paralympics.database_utils import event_file, region_file
+
+
+def read_rows(csv_file):
+    """Returns the header and the rows of a CSV file.
+
+    :param csv_file: Path to the CSV file
+    :return: (list of column names, list of lists of values)
+    """
+    with open(csv_file, encoding="utf-8-sig", newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        return header, list(reader)
+
+
+def generate_regions(size):
+    """Returns the header and size rows of regions, repeating the real regions with a number added to the NOC code.
+
+    The first copy has the real NOC codes, the next has 'AFG1', 'AHO1' etc.
+
+    :param size: number of rows
+    """
+    header, rows = read_rows(region_file)
+    noc_index = header.index("NOC")
+    generated = []
+    for number in range(size):
+        row = list(rows[number % len(rows)])
+        copy = number // len(rows)
+        if copy:
+            row[noc_index] = f"{row[noc_index]}{copy}"
+        generated.append(row)
+    return header, generated
+
+
+def generate_events(size, region_count):
+    """Returns the header and size rows of events, repeating the real events.
+
+    type and year are the natural key of an event, so each copy after the first adds a number to the type, e.g.
+    'summer1'. The NOC codes of each copy are from one of the copies of the regions made by generate_regions().
+
+    :param size: number of rows
+    :param region_count: number of regions generated by generate_regions()
+    """
+    header, rows = read_rows(event_file)
+    _, region_rows = read_rows(region_file)
+    type_index = header.index("type")
+    noc_index = header.index("NOC")
+    generated = []
+    for number in range(size):
+        row = list(rows[number % len(rows)])
+        copy = number // len(rows)
+        if copy:
+            row[type_index] = f"{row[type_index]}{copy}"
+            region_copy = copy % -(-region_count // len(region_rows))
+            if region_copy:
+                row[noc_index] = f"{row[noc_index]}{region_copy}"
+        generated.append(row)
+    return header, generated
+
+
+def write_csv(csv_file, header, rows):
+    with open(csv_file, "w", encoding="utf-8", newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(header)
+        writer.writerows(rows)
+
+
+def write_dataset(size, directory):
+    """Writes regions and events CSV files with size rows each.
+
+    :param size: number of rows in each file
+    :param directory: Path of the folder for the files
+    :return: (Path to the regions file, Path to the events file)
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    regions_csv = directory.joinpath(f"regions_{size}.csv")
+    events_csv = directory.joinpath(f"events_{size}.csv")
+    write_csv(regions_csv, *generate_regions(size))
+    write_csv(events_csv, *generate_events(size, size))
+    return regions_csv, events_csv
@@ -0,0 +1,201 @@
+# Runs the benchmarks for one dataset size and prints the results as JSON
+#
+# Each size is run in its own Python process by benchmarks.run, since the routes can only be added to one app per
+# process and so that each size starts with nothing cached in memory.
+#
+# python -m benchmarks.measure --size 1000 --workdir /tmp/bench
+import argparse
+import contextlib
+import io
+import json
+import logging
+import random
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.request import urlopen
+
+from benchmarks.datasets import write_dataset
+
+# Routes measured, with a function that returns the URL for each request from the random generator and the keys
+# in the database. The ids and NOCs are chosen at random so the requests are not all for the same rows.
+ROUTES = {
+    "events_page": lambda rng, keys: "/events?limit=100",
+    "events_page_after": lambda rng, keys: f"/events?limit=100&after={rng.choice(keys['event'])}",
+    "events_filtered": lambda rng, keys: "/events?type=summer&year_from=1990&limit=100",
+    "event": lambda rng, keys: f"/events/{rng.choice(keys['event'])}",
+    "event_with_region": lambda rng, keys: f"/events/{rng.choice(keys['event'])}?include=region",
+    "regions_page": lambda rng, keys: "/regions?limit=100",
+    "region": lambda rng, keys: f"/regions/{rng.choice(keys['region'])}",
+    "stats_participants": lambda rng, keys: "/stats/participants?type=summer",
+    "medals": lambda rng, keys: "/medals?type=summer",
+    "search": lambda rng, keys: "/search?q=wheelchair",
+}
+
+# Python code run in a new process to time importing the package, creating the app and the first request
+COLD_START_CODE = """
+import json, sys, time
+start = time.perf_counter()
+from paralympics import create_app
+app = create_app(json.loads(sys.argv[1]), config_name=sys.argv[2])
+created = time.perf_counter()
+response = app.test_client().get("/events?limit=1")
+assert response.status_code == 200, response.status_code
+print(json.dumps({"create_app_seconds": created - start, "first_request_seconds": time.perf_counter() - created}))
+"""
+
+
+def app_config(db_file, cache):
+    """Returns the test_config for create_app() for a benchmark database.
+
+    :param db_file: Path to the SQLite database file
+    :param cache: True to use the response cache
+    """
+    return {"SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_file}", "SQLALCHEMY_ECHO": False, "RESPONSE_CACHE": cache}
+
+
+def summarise(latencies, elapsed):
+    """Returns the request count, median, 99th percentile and mean latency in ms, and the requests per second.
+
+    :param latencies: list of seconds taken by each request
+    :param elapsed: seconds taken for all the requests
+    """
+    ordered = sorted(latencies)
+    return {
+        "requests": len(ordered),
+        "p50_ms": ordered[int(0.50 * (len(ordered) - 1))] * 1000,
+        "p99_ms": ordered[int(0.99 * (len(ordered) - 1))] * 1000,
+        "mean_ms": statistics.fmean(ordered) * 1000,
+        "throughput_rps": len(ordered) / elapsed,
+    }
+
+
+def seed(app, regions_csv, events_csv):
+    """Creates the tables and loads the data, returns the seconds taken by add_data()."""
+    from paralympics import db
+    from paralympics.database_utils import add_data, init_db
+
+    with app.app_context(), contextlib.redirect_stdout(io.StringIO()):
+        init_db(db)
+        start = time.perf_counter()
+        add_data(db, regions_csv, events_csv)
+        return time.perf_counter() - start
+
+
+def cold_start(db_file, cache, config_name):
+    """Returns the times to create the app and handle the first request, measured in a new Python process."""
+    start = time.perf_counter()
+    output = subprocess.run([sys.executable, "-c", COLD_START_CODE, json.dumps(app_config(db_file, cache)),
+                             config_name], check=True, capture_output=True, text=True,
+                            cwd=Path(__file__).parent.parent).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+    result["process_seconds"] = time.perf_counter() - start
+    return result
+
+
+def get_keys(app):
+    """Returns the event ids and region NOCs to choose from, at most 10000 of each."""
+    from paralympics import db
+    from paralympics.models import Event, Region
+
+    with app.app_context():
+        return {
+            "event": db.session.execute(db.select(Event.id).limit(10000)).scalars().all(),
+            "region": db.session.execute(db.select(Region.NOC).limit(10000)).scalars().all(),
+        }
+
+
+def bench_test_client(app, urls):
+    """Sends each request, one at a time, with the Flask test client."""
+    client = app.test_client()
+    for url in urls[:10]:
+        client.get(url)
+    latencies = []
+    start = time.perf_counter()
+    for url in urls:
+        request_start = time.perf_counter()
+        response = client.get(url)
+        latencies.append(time.perf_counter() - request_start)
+        if response.status_code != 200:
+            raise RuntimeError(f"GET {url} returned {response.status_code}")
+    return summarise(latencies, time.perf_counter() - start)
+
+
+def bench_wsgi(base_url, urls, concurrency):
+    """Sends the requests over HTTP to a local WSGI server, from concurrency threads at a time."""
+    def send(url):
+        request_start = time.perf_counter()
+        with urlopen(base_url + url) as response:
+            response.read()
+        return time.perf_counter() - request_start
+
+    with ThreadPoolExecutor(concurrency) as executor:
+        list(executor.map(send, urls[:10]))
+        start = time.perf_counter()
+        latencies = list(executor.map(send, urls))
+        return summarise(latencies, time.perf_counter() - start)
+
+
+def run(size, workdir, requests=500, concurrency=8, cache=False, config_name="production", seed_value=0):
+    """Runs all the benchmarks for one dataset size.
+
+    :param size: number of regions and of events
+    :param workdir: Path of a folder for the generated files and database
+    :param requests: number of requests for each route
+    :param concurrency: number of clients sending requests at the same time to the WSGI server
+    :param cache: True to use the response cache, False to measure the routes themselves
+    :param config_name: configuration profile, see paralympics/config.py
+    :param seed_value: seed for the random choice of ids and NOCs in the URLs
+    :return: dictionary of results
+    """
+    from werkzeug.serving import make_server
+    from paralympics import create_app
+
+    workdir = Path(workdir)
+    regions_csv, events_csv = write_dataset(size, workdir)
+    db_file = workdir.joinpath(f"paralympics_{size}.sqlite")
+    db_file.unlink(missing_ok=True)
+    app = create_app(app_config(db_file, cache), config_name=config_name)
+
+    results = {"size": size, "seed_seconds": seed(app, regions_csv, events_csv),
+               "cold_start": cold_start(db_file, cache, config_name), "routes": {}}
+
+    keys = get_keys(app)
+    rng = random.Random(seed_value)
+    route_urls = {name: [make_url(rng, keys) for _ in range(requests)] for name, make_url in ROUTES.items()}
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        for name, urls in route_urls.items():
+            results["routes"][name] = {
+                "test_client": bench_test_client(app, urls),
+                "wsgi": bench_wsgi(f"http://127.0.0.1:{server.port}", urls, concurrency),
+            }
+    finally:
+        server.shutdown()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the paralympics app for one dataset size")
+    parser.add_argument("--size", type=int, required=True, help="number of regions and of events")
+    parser.add_argument("--workdir", required=True, help="folder for the generated data and database")
+    parser.add_argument("--requests", type=int, default=500, help="requests for each route")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients for the WSGI server")
+    parser.add_argument("--cache", action="store_true", help="use the response cache")
+    parser.add_argument("--config", default="production", help="configuration profile")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the URLs")
+    args = parser.parse_args()
+    results = run(args.size, args.workdir, args.requests, args.concurrency, args.cache, args.config, args.seed)
+    print(json.dumps(results))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,77 @@
+# Runs the benchmarks for each dataset size and writes the results to a JSON file
+#
+# python -m benchmarks.run --sizes 1000 10000 100000 --output benchmark_results.json
+# python -m benchmarks.run --baseline benchmarks/baseline.json   (exit code 1 if slower than the baseline)
+#
+# Each size is run by benchmarks.measure in a new Python process. Results depend on the computer, so compare them
+# with a baseline made on the same computer.
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from benchmarks.compare import compare, report
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+
+
+def run_size(size, workdir, args):
+    """Runs benchmarks.measure for one size in a new process and returns its results."""
+    command = [sys.executable, "-m", "benchmarks.measure", "--size", str(size), "--workdir", str(workdir),
+               "--requests", str(args.requests), "--concurrency", str(args.concurrency), "--config", args.config,
+               "--seed", str(args.seed)]
+    if args.cache:
+        command.append("--cache")
+    output = subprocess.run(command, check=True, capture_output=True, text=True,
+                            cwd=Path(__file__).parent.parent).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the paralympics app")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES,
+                        help="numbers of regions and events, e.g. 1000 1000000")
+    parser.add_argument("--requests", type=int, default=500, help="requests for each route")
+    parser.add_argument("--concurrency", type=int, default=8, help="concurrent clients for the WSGI server")
+    parser.add_argument("--cache", action="store_true", help="use the response cache")
+    parser.add_argument("--config", default="production", help="configuration profile")
+    parser.add_argument("--seed", type=int, default=0, help="random seed for the URLs")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file for the results")
+    parser.add_argument("--baseline", help="JSON file of earlier results to compare with")
+    parser.add_argument("--threshold", type=float, default=0.2, help="allowed change, e.g. 0.2 for 20%%")
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+            "config": args.config,
+            "seed": args.seed,
+        },
+        "sizes": {},
+    }
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in args.sizes:
+            print(f"Running the benchmarks with {size} rows", file=sys.stderr)
+            results["sizes"][str(size)] = run_size(size, workdir, args)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        sys.exit(report(compare(results, baseline, args.threshold), args.threshold))
+
+
+if __name__ == "__main__":
+    main()
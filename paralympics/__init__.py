@@ -1,7 +1,8 @@
 import os
 
-from flask import Flask
+from flask import Flask, current_app, has_request_context, request
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event
 from sqlalchemy.orm import DeclarativeBase
 from flask_marshmallow import Marshmallow
 
@@ -18,7 +19,60 @@ db = SQLAlchemy(model_class=Base)
 # See https://flask-marshmallow.readthedocs.io/en/latest/#optional-flask-sqlalchemy-integration
 ma = Marshmallow()
 
-def create_app(test_config=None):
+def check_schema_version():
+    """Checks that the database has been created with the current schema version.
+
+    The result is cached in app.extensions, so the database is only queried until the check has passed once.
+    If the database is out of date then a 503 response is returned instead of handling the request.
+    """
+    if current_app.extensions.get("paralympics_schema_checked"):
+        return None
+    from paralympics.database_utils import get_schema_version
+    from paralympics.models import SCHEMA_VERSION
+    version = get_schema_version(db)
+    if version != SCHEMA_VERSION:
+        message = (f"Database schema version is {version}, expected {SCHEMA_VERSION}. "
+                   f"Run 'flask --app paralympics paralympics init-db'.")
+        return {"message": message}, 503
+    current_app.extensions["paralympics_schema_checked"] = True
+    return None
+
+
+def sqlite_pragma_listener(pragmas):
+    """Returns a function for the SQLAlchemy 'connect' event that sets SQLite pragmas on each new connection.
+
+    :param pragmas: dictionary of pragma name and value, e.g. {"journal_mode": "WAL"}
+    """
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name} = {value}")
+        cursor.close()
+    return set_pragmas
+
+
+def read_only_uri(database_uri, immutable=False):
+    """Returns a SQLite URI that opens the same database file in read-only mode.
+
+    :param database_uri: the SQLALCHEMY_DATABASE_URI, e.g. sqlite:////path/to/paralympics.sqlite
+    :param immutable: if True, SQLite does not check whether the file has changed
+    """
+    path = database_uri.removeprefix("sqlite:///")
+    uri = f"sqlite:///file:{path}?mode=ro&uri=true"
+    return uri + "&immutable=1" if immutable else uri
+
+
+def read_bind():
+    """Returns bind_arguments that run a query on the read-only engine, if there is one, for GET requests.
+
+    Usage: db.session.execute(db.select(Event), bind_arguments=read_bind())
+    """
+    if has_request_context() and request.method == "GET" and "read_only" in db.engines:
+        return {"bind": db.engines["read_only"]}
+    return {}
+
+
+def create_app(test_config=None, config_name=None):
     # create and configure the app
     app = Flask(__name__, instance_relative_config=True)
 
@@ -27,9 +81,13 @@ def create_app(test_config=None):
         SECRET_KEY='l-tirPCf1S44mWAGoWqWlA',
         # configure the SQLite database, relative to the app instance folder
         SQLALCHEMY_DATABASE_URI="sqlite:///" + os.path.join(app.instance_path, 'paralympics.sqlite'),
-        SQLALCHEMY_ECHO=True
     )
 
+    # load the named configuration profile, see config.py
+    from paralympics.config import configs
+    config_name = config_name or os.environ.get("PARALYMPICS_CONFIG", "development")
+    app.config.from_object(configs[config_name])
+
     if test_config is None:
         # load the instance config, if it exists, when not testing
         app.config.from_pyfile('config.py', silent=True)
@@ -43,25 +101,60 @@ def create_app(test_config=None):
     except OSError:
         pass
 
+    # Add a second engine that opens the database file read-only, used for GET requests by read_bind()
+    database_uri = app.config["SQLALCHEMY_DATABASE_URI"]
+    in_memory = ":memory:" in database_uri
+    if app.config["SQLITE_READ_ONLY_ENGINE"] and database_uri.startswith("sqlite:///") and not in_memory:
+        binds = dict(app.config.get("SQLALCHEMY_BINDS") or {})
+        binds.setdefault("read_only", read_only_uri(database_uri, app.config["SQLITE_READ_ONLY_IMMUTABLE"]))
+        app.config["SQLALCHEMY_BINDS"] = binds
+
     # Initialise Flask with the SQLAlchemy database extension
     db.init_app(app)
 
+    # Set the SQLite pragmas on each new connection. journal_mode and synchronous cannot be changed on a read-only
+    # connection; WAL mode is saved in the database file, so read-only connections use it anyway.
+    pragmas = app.config["SQLITE_PRAGMAS"]
+    if pragmas:
+        with app.app_context():
+            for bind_key, engine in db.engines.items():
+                if bind_key == "read_only":
+                    engine_pragmas = {k: v for k, v in pragmas.items() if k not in ("journal_mode", "synchronous")}
+                else:
+                    engine_pragmas = pragmas
+                event.listen(engine, "connect", sqlite_pragma_listener(engine_pragmas))
+
+    # Time the requests and their queries, see metrics.py
+    if app.config["METRICS"]:
+        from paralympics import metrics
+        metrics.init_app(app)
+
     # Initialise Flask-Marshmallow
     ma.init_app(app)
 
-    # Models are defined in the models module, so you must import them before calling create_all, otherwise SQLAlchemy
-    # will not know about them.
-    from paralympics.models import User, Region, Event
-    # Create the tables in the database
-    # create_all does not update tables if they are already in the database.
-    with app.app_context():
-        # Create the database and tables if they don't already exist
-        db.create_all()
+    # The database tables are created and the data added using the CLI commands rather than here, so that starting
+    # the app (e.g. each Gunicorn worker) does not query the database:
+    # flask --app paralympics paralympics init-db
+    # flask --app paralympics paralympics seed
+    from paralympics.cli import paralympics_cli
+    app.cli.add_command(paralympics_cli)
+
+    # Check the database schema version when the first request is handled, rather than when the app is created
+    app.before_request(check_schema_version)
 
-        # Add the data to the database if not already added
-        from paralympics.database_utils import add_data
-        add_data(db)
+    # Cache GET responses in this process, the cache is cleared when the data changes, see cache.py
+    if app.config["RESPONSE_CACHE"]:
+        from paralympics.cache import ResponseCache
+        app.extensions["response_cache"] = ResponseCache(app.config["RESPONSE_CACHE_MAX_ENTRIES"],
+                                                         app.config["RESPONSE_CACHE_MAX_BYTES"],
+                                                         app.config["RESPONSE_CACHE_TTL"])
 
+    # Read regions and events from memory, the snapshot is built by the first request that uses it, see snapshot.py
+    if app.config["SNAPSHOT"]:
+        from paralympics.snapshot import SnapshotStore
+        app.extensions["snapshot"] = SnapshotStore(app.config["SNAPSHOT_CHECK_INTERVAL"])
+
+    with app.app_context():
         # Register the routes with the app in the context
         from paralympics import paralympics
 
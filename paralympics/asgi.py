@@ -0,0 +1,178 @@
+# Optional ASGI app that serves the region and event GET routes with async SQLAlchemy sessions
+#
+# A WSGI worker thread waits while SQLite runs each query, so the number of requests a process can handle at once is
+# the number of threads. This ASGI app runs the queries for GET /regions, /regions/<NOC>, /events and /events/<id>
+# with an AsyncSession using the aiosqlite driver, so a waiting request only holds a coroutine, and a semaphore limits
+# how many of the queries run at the same time. The queries, JSON and status codes are the same as the Flask routes
+# (see ROUTE_QUERIES in paralympics.py). All other requests are passed to the Flask app, which asgiref runs in a thread.
+#
+# The async routes do not use the response cache, the snapshot or the metrics, which are part of the Flask request
+# handling.
+#
+# Needs: pip install "sqlalchemy[asyncio]" aiosqlite asgiref uvicorn (the asyncio extra installs greenlet)
+# Run:   uvicorn --factory paralympics.asgi:create_asgi_app
+import asyncio
+import io
+import sys
+
+from asgiref.wsgi import WsgiToAsgi
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from werkzeug.exceptions import HTTPException, NotFound, MethodNotAllowed
+
+from paralympics import create_app, read_only_uri, sqlite_pragma_listener
+
+
+def async_database_uri(database_uri):
+    """Returns the URI for the aiosqlite driver, e.g. sqlite+aiosqlite:////path/to/paralympics.sqlite"""
+    return database_uri.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+
+def build_environ(scope):
+    """Returns a WSGI environ for an ASGI HTTP request with no body, used to create the Flask request context.
+
+    :param scope: the ASGI connection scope
+    """
+    server_name, server_port = scope.get("server") or ("localhost", 80)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server_name,
+        "SERVER_PORT": str(server_port),
+        "SERVER_PROTOCOL": f"HTTP/{scope['http_version']}",
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        name = name.decode("latin-1").upper().replace("-", "_")
+        if name not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            name = f"HTTP_{name}"
+        environ[name] = value.decode("latin-1")
+    return environ
+
+
+class AsyncApp:
+    """ASGI app that runs the region and event GET routes with async sessions and passes other requests to Flask.
+
+    :param flask_app: the app from create_app()
+    """
+
+    def __init__(self, flask_app):
+        from paralympics.paralympics import ROUTE_QUERIES
+
+        self.flask_app = flask_app
+        self.wsgi_app = WsgiToAsgi(flask_app)
+        self.route_queries = ROUTE_QUERIES
+        config = flask_app.config
+        self.max_concurrency = config["ASYNC_MAX_CONCURRENCY"]
+        self.queue_timeout = config["ASYNC_QUEUE_TIMEOUT"]
+        # Created when the first request is handled, so that it belongs to the server's event loop
+        self._limiter = None
+        self._schema_checked = False
+
+        # Each aiosqlite connection has its own thread, so there is one connection for each query that can run at
+        # the same time. The database file is opened read-only if the Flask app uses a read-only engine.
+        database_uri = config["SQLALCHEMY_DATABASE_URI"]
+        pragmas = dict(config["SQLITE_PRAGMAS"])
+        if config["SQLITE_READ_ONLY_ENGINE"] and ":memory:" not in database_uri:
+            database_uri = read_only_uri(database_uri, config["SQLITE_READ_ONLY_IMMUTABLE"])
+            pragmas = {k: v for k, v in pragmas.items() if k not in ("journal_mode", "synchronous")}
+        self.engine = create_async_engine(async_database_uri(database_uri), pool_size=self.max_concurrency,
+                                          max_overflow=0)
+        if pragmas:
+            event.listen(self.engine.sync_engine, "connect", sqlite_pragma_listener(pragmas))
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            await self.lifespan(receive, send)
+        elif scope["type"] == "http" and scope["method"] in ("GET", "HEAD"):
+            endpoint, view_args = self.match(scope)
+            if endpoint in self.route_queries:
+                await self.handle(scope, send, self.route_queries[endpoint], view_args)
+            else:
+                await self.wsgi_app(scope, receive, send)
+        else:
+            await self.wsgi_app(scope, receive, send)
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif message["type"] == "lifespan.shutdown":
+                await self.engine.dispose()
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+
+    def match(self, scope):
+        """Returns the Flask endpoint name and URL variables for the request, or (None, None) if there is no route."""
+        adapter = self.flask_app.url_map.bind(scope.get("server", ("localhost",))[0],
+                                              script_name=scope.get("root_path") or None)
+        try:
+            return adapter.match(scope["path"], method="GET")
+        except (NotFound, MethodNotAllowed):
+            return None, None
+        except HTTPException:
+            # e.g. a redirect to add a trailing slash, which Flask handles
+            return None, None
+
+    async def check_schema_version(self, session):
+        """Returns a 503 message if the database is not at the current schema version, like the Flask app does."""
+        from paralympics.models import SCHEMA_VERSION
+
+        if self._schema_checked:
+            return None
+        version = (await session.execute(text("PRAGMA user_version"))).scalar()
+        if version != SCHEMA_VERSION:
+            return (f"Database schema version is {version}, expected {SCHEMA_VERSION}. "
+                    f"Run 'flask --app paralympics paralympics init-db'.")
+        self._schema_checked = True
+        return None
+
+    async def handle(self, scope, send, route_query, view_args):
+        """Runs one of the route queries with an async session and sends the response."""
+        if self._limiter is None:
+            self._limiter = asyncio.Semaphore(self.max_concurrency)
+        with self.flask_app.request_context(build_environ(scope)):
+            try:
+                query, render = route_query(**view_args)
+                try:
+                    await asyncio.wait_for(self._limiter.acquire(), self.queue_timeout)
+                except asyncio.TimeoutError:
+                    response = self.flask_app.response_class(
+                        b'{"message":"The server is busy, try again later"}\n', status=503,
+                        mimetype="application/json", headers={"Retry-After": "1"})
+                else:
+                    try:
+                        async with self.sessionmaker() as session:
+                            message = await self.check_schema_version(session)
+                            if message is not None:
+                                response = self.flask_app.json.response({"message": message})
+                                response.status_code = 503
+                            else:
+                                response = render(await session.execute(query))
+                    finally:
+                        self._limiter.release()
+            except HTTPException as e:
+                response = e.get_response()
+            await self.send_response(scope, send, response)
+
+    async def send_response(self, scope, send, response):
+        body = response.get_data()
+        headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+                   for name, value in response.headers.items()]
+        await send({"type": "http.response.start", "status": response.status_code, "headers": headers})
+        await send({"type": "http.response.body", "body": b"" if scope["method"] == "HEAD" else body})
+
+
+def create_asgi_app(test_config=None, config_name=None):
+    """Creates the Flask app and returns the ASGI app that serves it, see create_app() for the arguments."""
+    return AsyncApp(create_app(test_config, config_name))
@@ -0,0 +1,283 @@
+# Batch writes: create, update or delete many events or regions in one request and one transaction
+#
+# All the items are validated with one schema.load(many=True) call. The valid items are then written with bulk INSERT
+# and UPDATE statements, rather than an ORM object, flush and commit for each item, and the request returns a result
+# for each item. Bulk statements do not flush ORM objects, so the response cache and summary tables are updated here
+# rather than by the session event listeners in cache.py and stats.py.
+#
+# The primary and unique keys, and the rows that refer to a deleted row, are checked for all the items before anything
+# is written, so an item that would break a constraint has its own 409 result instead of failing the whole batch.
+from marshmallow import ValidationError
+from sqlalchemy import delete, insert, select, tuple_, update
+
+from paralympics import db
+from paralympics.cache import mark_tables_changed
+from paralympics.models import Event
+from paralympics.stats import refresh_stats
+
+# The most items accepted in one batch request
+MAX_BATCH_SIZE = 10000
+
+
+def validate_items(schema_class, items, partial=False):
+    """Loads all the items with one schema pass.
+
+    :param schema_class: Marshmallow schema class, e.g. EventSchema
+    :param items: list of dictionaries from the request JSON
+    :param partial: True to allow required fields to be left out, for updates
+    :return: (list of loaded dictionaries, dictionary of item index: errors)
+    """
+    schema = schema_class(many=True, load_instance=False)
+    try:
+        return schema.load(items, partial=partial), {}
+    except ValidationError as error:
+        return error.valid_data, error.messages
+
+
+def existing_keys(key_column, keys):
+    """Returns the set of keys that are in the table.
+
+    :param key_column: primary key column, e.g. Event.id
+    :param keys: values to look for
+    """
+    found = set()
+    keys = list(keys)
+    # SQLite allows a limited number of parameters in one statement
+    for start in range(0, len(keys), 500):
+        found.update(db.session.execute(select(key_column).where(key_column.in_(keys[start:start + 500]))).scalars())
+    return found
+
+
+def unique_keys(table):
+    """Returns the column names of each unique index of a table, e.g. [("type", "year")] for the events."""
+    return [tuple(column.name for column in index.columns) for index in table.indexes if index.unique]
+
+
+def existing_unique_keys(table, key_column, names, values):
+    """Returns the primary key of the row that has each of the values of a unique key.
+
+    :param table: SQLAlchemy Table
+    :param key_column: primary key column, e.g. Event.id
+    :param names: column names of the unique key, e.g. ("type", "year")
+    :param values: tuples of values of the unique key to look for
+    :return: dictionary of unique key values: primary key
+    """
+    columns = [table.columns[name] for name in names]
+    found = {}
+    values = list(values)
+    # SQLite allows a limited number of parameters in one statement
+    step = 500 // len(names)
+    for start in range(0, len(values), step):
+        rows = db.session.execute(select(key_column, *columns)
+                                  .where(tuple_(*columns).in_(values[start:start + step])))
+        for row in rows:
+            found[tuple(row[1:])] = row[0]
+    return found
+
+
+def current_values(table, key_column, keys, names):
+    """Returns the values of some columns of the rows with the keys, as a dictionary of primary key: values."""
+    columns = [table.columns[name] for name in names]
+    values = {}
+    keys = list(keys)
+    for start in range(0, len(keys), 500):
+        rows = db.session.execute(select(key_column, *columns).where(key_column.in_(keys[start:start + 500])))
+        for row in rows:
+            values[row[0]] = dict(zip(names, row[1:]))
+    return values
+
+
+def check_repeated_keys(key_name, rows, results):
+    """Sets a 409 result for each item with the same primary key as an earlier item in the batch.
+
+    :param key_name: name of the primary key
+    :param rows: dictionary of item index: loaded values, for the items that do not have a result yet
+    :param results: list of results for each item, changed in place
+    """
+    seen = set()
+    for index, row in rows.items():
+        key = row.get(key_name)
+        if key is None:
+            continue
+        if key in seen:
+            results[index] = {"status": 409, "errors": {key_name: [f"{key} is repeated in the batch."]}}
+        seen.add(key)
+
+
+def check_unique_keys(table, key_name, operation, rows, results):
+    """Sets a 409 result for each create or update that would repeat a unique key, of a row in the table or of an
+    earlier item in the batch.
+
+    :param table: SQLAlchemy Table
+    :param key_name: name of the primary key
+    :param operation: 'create' or 'update'
+    :param rows: dictionary of item index: loaded values, for the items that do not have a result yet
+    :param results: list of results for each item, changed in place
+    """
+    key_column = table.columns[key_name]
+    for names in unique_keys(table):
+        changed = {index: row for index, row in rows.items()
+                   if results[index] is None and any(name in row for name in names)}
+        if operation == "update":
+            # An update may only change part of the key, the rest is the row's current value
+            current = current_values(table, key_column, (row[key_name] for row in changed.values()), names)
+        new_keys = {}
+        for index, row in changed.items():
+            values = {**current.get(row[key_name], {}), **row} if operation == "update" else row
+            value = tuple(values.get(name) for name in names)
+            if None not in value:
+                new_keys[index] = value
+
+        found = existing_unique_keys(table, key_column, names, set(new_keys.values()))
+        seen = set()
+        for index, value in new_keys.items():
+            owner = found.get(value)
+            if value in seen:
+                message = f"{', '.join(map(str, value))} is repeated in the batch."
+            elif owner is not None and owner != rows[index].get(key_name):
+                message = f"{', '.join(map(str, value))} already exists."
+            else:
+                seen.add(value)
+                continue
+            results[index] = {"status": 409, "errors": {name: [message] for name in names}}
+
+
+def referencing_columns(table):
+    """Returns the foreign key columns of the other tables that refer to a table, e.g. event.NOC for the regions.
+
+    :param table: SQLAlchemy Table
+    :return: list of (foreign key column, the column of the table it refers to)
+    """
+    return [(foreign_key.parent, foreign_key.column) for other in table.metadata.sorted_tables
+            for foreign_key in other.foreign_keys if foreign_key.column.table is table]
+
+
+def check_dependent_rows(table, key_name, rows, results):
+    """Sets a 409 result for each delete of a row that other tables refer to, e.g. a region that has events.
+
+    :param table: SQLAlchemy Table
+    :param key_name: name of the primary key
+    :param rows: dictionary of item index: {key_name: key}, for the items that do not have a result yet
+    :param results: list of results for each item, changed in place
+    """
+    key_column = table.columns[key_name]
+    columns = [column for column, referenced in referencing_columns(table) if referenced is key_column]
+    for column in columns:
+        used = existing_keys(column, (row[key_name] for row in rows.values()))
+        for index, row in rows.items():
+            if results[index] is None and row[key_name] in used:
+                results[index] = {"status": 409, "errors": {key_name: [
+                    f"{row[key_name]} has {column.table.name}s, delete them first."]}}
+
+
+def event_stats_keys(event_ids):
+    """Returns the (type, year) and NOC of events, used to recalculate their summary rows.
+
+    :param event_ids: ids of the events
+    :return: (set of (type, year), set of NOC)
+    """
+    year_keys, nocs = set(), set()
+    event_ids = list(event_ids)
+    for start in range(0, len(event_ids), 500):
+        rows = db.session.execute(select(Event.type, Event.year, Event.NOC)
+                                  .where(Event.id.in_(event_ids[start:start + 500])))
+        for row in rows:
+            year_keys.add((row.type, row.year))
+            nocs.add(row.NOC)
+    return year_keys, nocs
+
+
+def apply_batch(model, key_name, schema_class, operation, items):
+    """Validates and applies a batch of creates, updates or deletes in one transaction.
+
+    :param model: Event or Region
+    :param key_name: name of the primary key, 'id' or 'NOC'
+    :param schema_class: Marshmallow schema class for the model
+    :param operation: 'create', 'update' or 'delete'
+    :param items: for create, a list of objects; for update, a list of objects with the key and the fields to
+        change; for delete, a list of keys
+    :return: list with a result for each item, e.g. {"status": 201, "id": 33} or {"status": 400, "errors": {...}}
+    """
+    table = model.__table__
+    key_column = table.columns[key_name]
+    results = [None] * len(items)
+    rows = {}
+
+    if operation == "delete":
+        for index, key in enumerate(items):
+            if isinstance(key, (str, int)) and not isinstance(key, bool):
+                rows[index] = {key_name: key}
+            else:
+                results[index] = {"status": 400, "errors": {key_name: ["Not a valid key."]}}
+    else:
+        loaded, errors = validate_items(schema_class, items, partial=(operation == "update"))
+        for index, values in enumerate(loaded):
+            if index in errors:
+                results[index] = {"status": 400, "errors": errors[index]}
+            elif operation == "update" and values.get(key_name) is None:
+                results[index] = {"status": 400, "errors": {key_name: ["Missing data for required field."]}}
+            else:
+                rows[index] = values
+
+    # Updates and deletes need an existing row, creates must not repeat a key
+    keys = {index: row.get(key_name) for index, row in rows.items() if row.get(key_name) is not None}
+    found = existing_keys(key_column, keys.values())
+    for index, key in keys.items():
+        if operation == "create" and key in found:
+            results[index] = {"status": 409, "errors": {key_name: [f"{key} already exists."]}}
+        elif operation != "create" and key not in found:
+            results[index] = {"status": 404, "errors": {key_name: [f"{key} not found."]}}
+    rows = {index: row for index, row in rows.items() if results[index] is None}
+    # Unique keys and rows that refer to a deleted row would otherwise fail the whole batch when it is written
+    # The primary key of each item can only be used once in a batch
+    check_repeated_keys(key_name, rows, results)
+    rows = {index: row for index, row in rows.items() if results[index] is None}
+    if operation == "delete":
+        check_dependent_rows(table, key_name, rows, results)
+    else:
+        check_unique_keys(table, key_name, operation, rows, results)
+    rows = {index: row for index, row in rows.items() if results[index] is None}
+    if not rows:
+        return results
+
+    # Summary rows to recalculate, from the values before and after the change
+    year_keys, nocs = set(), set()
+    if model is Event:
+        if operation != "create":
+            year_keys, nocs = event_stats_keys(row[key_name] for row in rows.values())
+        for row in rows.values():
+            if "type" in row and "year" in row:
+                year_keys.add((row["type"], row["year"]))
+            nocs.add(row.get("NOC"))
+        nocs.discard(None)
+
+    indexes = list(rows)
+    if operation == "create":
+        # executemany needs the same columns in every row, so fields that were left out are NULL. For events a NULL
+        # id is given the next id by SQLite. RETURNING gives the new primary keys, in the same order as the rows.
+        empty_row = dict.fromkeys(table.columns.keys())
+        statement = insert(table).returning(key_column, sort_by_parameter_order=True)
+        new_keys = db.session.execute(statement, [{**empty_row, **rows[index]} for index in indexes]).scalars().all()
+        for index, key in zip(indexes, new_keys):
+            results[index] = {"status": 201, key_name: key}
+    elif operation == "update":
+        # ORM bulk UPDATE by primary key, rows with different fields are grouped into separate executemany calls
+        db.session.execute(update(model), [rows[index] for index in indexes])
+        for index in indexes:
+            results[index] = {"status": 200, key_name: rows[index][key_name]}
+    else:
+        for start in range(0, len(indexes), 500):
+            chunk = [rows[index][key_name] for index in indexes[start:start + 500]]
+            db.session.execute(delete(table).where(key_column.in_(chunk)))
+        for index in indexes:
+            results[index] = {"status": 202, key_name: rows[index][key_name]}
+
+    if model is Event:
+        if operation == "update":
+            # Updated rows may not have had type and year in the request, so read the new values
+            new_year_keys, new_nocs = event_stats_keys(rows[index][key_name] for index in indexes)
+            year_keys |= new_year_keys
+            nocs |= new_nocs - {None}
+        refresh_stats(db.session.connection(), year_keys, nocs)
+    mark_tables_changed(db.session, {table.name})
+    return results
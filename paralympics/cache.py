@@ -0,0 +1,225 @@
+# In-process cache of GET responses with ETags, invalidated when the data changes
+#
+# Each cached response is tagged with the tables it was created from and the version of each table at the time.
+# TableVersion rows are increased in the same transaction as any ORM change to a cached table (after_flush below) and
+# by the bulk loaders in database_utils, so a cached response is only used if no process has changed its tables since.
+# Checking the versions is one query of a table with a few rows, instead of running the route's query and serializing
+# the result. Changes made to the database outside the app (e.g. with an SQLite client) are not seen by the cache.
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, has_app_context, make_response, request
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from paralympics import db, read_bind
+from paralympics.models import TableVersion
+
+# Tables that cached responses can depend on
+CACHED_TABLES = {"event", "medal", "region"}
+
+
+class ResponseCache:
+    """Least recently used cache of response bodies, limited by number of entries, total size and age.
+
+    :param max_entries: most responses kept
+    :param max_bytes: most bytes of response bodies kept
+    :param ttl: seconds a response is kept for
+    """
+
+    def __init__(self, max_entries=1024, max_bytes=64 * 1024 * 1024, ttl=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.size = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, versions):
+        """Returns the cached entry for the key if it is in date, otherwise None.
+
+        :param key: the cache key
+        :param versions: dictionary of the current version of each table
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry["expires"] < time.monotonic() or any(
+                    versions.get(table, 0) != version for table, version in entry["versions"].items()):
+                self._remove(key)
+                return None
+            self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        """Adds an entry, removing the least recently used entries if the cache is full.
+
+        :param key: the cache key
+        :param entry: dictionary with 'body' (bytes), 'versions' (version of each table the body depends on) and any
+            other values needed to recreate the response
+        """
+        if len(entry["body"]) > self.max_bytes:
+            return
+        entry["expires"] = time.monotonic() + self.ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            self.size += len(entry["body"])
+            while len(self._entries) > self.max_entries or self.size > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def invalidate(self, tables):
+        """Removes the entries that depend on any of the tables.
+
+        :param tables: set of table names
+        """
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if tables & entry["versions"].keys()]:
+                self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key)
+        self.size -= len(entry["body"])
+
+
+def make_etag(body):
+    """Returns a strong ETag for a response body."""
+    return '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+
+
+def read_table_versions():
+    """Reads the current version of each table from the database, e.g. {'event': 3, 'region': 1}"""
+    rows = db.session.execute(db.select(TableVersion.table_name, TableVersion.version), bind_arguments=read_bind())
+    return dict(rows.all())
+
+
+def get_table_versions(from_snapshot=False):
+    """Returns the current version of each table.
+
+    A response served from the snapshot (see snapshot.py) is as up to date as the snapshot, so its versions are the
+    snapshot's, which does not need a query. All other responses read the versions from the database, so they are
+    never older than the data.
+
+    :param from_snapshot: True if the response is served from the snapshot in snapshot mode
+    """
+    store = current_app.extensions.get("snapshot")
+    if from_snapshot and store is not None:
+        return store.get().versions
+    return read_table_versions()
+
+
+def bump_table_versions(connection, tables):
+    """Increases the version of each table, in the transaction of the connection.
+
+    :param connection: SQLAlchemy connection, e.g. db.session.connection()
+    :param tables: names of the tables that have changed
+    """
+    statement = sqlite_insert(TableVersion.__table__)
+    statement = statement.on_conflict_do_update(index_elements=["table_name"],
+                                                set_={"version": TableVersion.__table__.c.version + 1})
+    connection.execute(statement, [{"table_name": table, "version": 1} for table in sorted(tables)])
+
+
+def mark_tables_changed(session, tables):
+    """Increases the version of each table in the session's transaction, and removes the responses that depend on the
+    tables from this process's cache when the transaction is committed.
+
+    This is done automatically for changes made with ORM objects. Call it after changing a cached table with Core or
+    ORM bulk statements, which do not flush ORM objects.
+
+    :param session: SQLAlchemy session, e.g. db.session
+    :param tables: names of the tables that have changed
+    """
+    bump_table_versions(session.connection(), tables)
+    session.info.setdefault("changed_tables", set()).update(tables)
+
+
+def cached(*tables, include_tables=None, snapshot=False):
+    """Decorator for GET routes that caches the JSON response and handles ETag / If-None-Match.
+
+    The cache key is the path and the query string arguments. If the request's If-None-Match matches the ETag, a
+    304 response with no body is returned. Only 200 responses are cached.
+
+    :param tables: names of the tables the response is created from, e.g. "event"
+    :param include_tables: dictionary of the table each value of the 'include' argument adds, e.g.
+        {"region": "region"}
+    :param snapshot: True if the route serves requests without 'include' from the snapshot in snapshot mode
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = current_app.extensions.get("response_cache")
+            if cache is None:
+                return view(*args, **kwargs)
+
+            depends_on = set(tables)
+            for name in request.args.get("include", "").split(","):
+                if include_tables and name.strip() in include_tables:
+                    depends_on.add(include_tables[name.strip()])
+            key = (request.path, tuple(sorted(request.args.items(multi=True))))
+            # Requests that include related rows are not served from the snapshot, see paralympics.get_snapshot
+            versions = get_table_versions(snapshot and not request.args.get("include"))
+
+            entry = cache.get(key, versions)
+            if entry is None:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = {
+                    "body": response.get_data(),
+                    "mimetype": response.mimetype,
+                    "headers": [(name, value) for name, value in response.headers.items()
+                                if name in ("Link", "Vary")],
+                    "etag": None,
+                    "versions": {table: versions.get(table, 0) for table in depends_on},
+                }
+                entry["etag"] = make_etag(entry["body"])
+                cache.set(key, entry)
+
+            if request.if_none_match.contains(entry["etag"].strip('"')):
+                response = current_app.response_class(status=304)
+            else:
+                response = current_app.response_class(entry["body"], mimetype=entry["mimetype"])
+                response.headers.extend(entry["headers"])
+            response.headers["ETag"] = entry["etag"]
+            return response
+        return wrapper
+    return decorator
+
+
+# Track the cached tables changed by the ORM in each transaction, increase their versions in the same transaction,
+# and remove the responses that depend on them from this process's cache after the commit.
+@event.listens_for(Session, "after_flush")
+def record_changed_tables(session, flush_context):
+    changed = {instance.__table__.name for instance in (*session.new, *session.dirty, *session.deleted)
+               if getattr(instance, "__table__", None) is not None} & CACHED_TABLES
+    if changed:
+        mark_tables_changed(session, changed)
+
+
+@event.listens_for(Session, "after_commit")
+def invalidate_changed_tables(session):
+    changed = session.info.pop("changed_tables", None)
+    if changed and has_app_context():
+        cache = current_app.extensions.get("response_cache")
+        if cache is not None:
+            cache.invalidate(changed)
+        store = current_app.extensions.get("snapshot")
+        if store is not None:
+            store.expire()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_changed_tables(session):
+    session.info.pop("changed_tables", None)
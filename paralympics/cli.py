@@ -0,0 +1,42 @@
+# Flask CLI commands to create the database and add the data
+# See https://flask.palletsprojects.com/en/3.0.x/cli/#custom-commands
+# The database_utils imports are inside the commands so that they are only imported when a command is run, and not
+# every time the app is created.
+import click
+from flask import current_app
+from flask.cli import AppGroup
+
+from paralympics import db
+
+# AppGroup commands run inside the app context, e.g. 'flask --app paralympics paralympics init-db'
+paralympics_cli = AppGroup("paralympics", help="Create the paralympics database and add the data.")
+
+
+@paralympics_cli.command("init-db")
+def init_db_command():
+    """Create the database tables and save the schema version."""
+    from paralympics.database_utils import init_db
+    init_db(db)
+    click.echo("Initialised the database.")
+
+
+@paralympics_cli.command("seed")
+def seed_command():
+    """Add the region and event data to empty tables."""
+    from paralympics.database_utils import add_data
+    add_data(db)
+
+
+@paralympics_cli.command("sync-data")
+def sync_data_command():
+    """Apply changes in the region and event CSV files to the database."""
+    from paralympics.database_utils import sync_data
+    sync_data(db)
+
+
+@paralympics_cli.command("check-indexes")
+def check_indexes_command():
+    """Check that the event filter and medal table queries use the indexes (EXPLAIN QUERY PLAN)."""
+    from paralympics.database_utils import check_query_plans
+    check_query_plans(db, current_app._get_current_object())
+    click.echo("All event filter queries use an index.")
@@ -0,0 +1,62 @@
+# Named configuration profiles for the app, selected with create_app(config_name=...) or the PARALYMPICS_CONFIG
+# environment variable, e.g. PARALYMPICS_CONFIG=production gunicorn "paralympics:create_app()"
+# See https://flask.palletsprojects.com/en/3.0.x/config/#development-production
+# Settings that depend on the instance folder, such as the database location, are set in create_app.
+
+
+class DevelopmentConfig:
+    """Settings used when running the app with 'flask --app paralympics run'."""
+    # Log every SQL statement, useful when learning SQLAlchemy but slow under load
+    SQLALCHEMY_ECHO = True
+    # SQLite pragmas set on each new database connection, see https://www.sqlite.org/pragma.html
+    SQLITE_PRAGMAS = {}
+    # Use a second, read-only, connection to the database file for GET requests
+    SQLITE_READ_ONLY_ENGINE = False
+    # Open the read-only connection with immutable=1, only use this if nothing writes to the database while the
+    # app is running as SQLite will not see any changes made to the file
+    SQLITE_READ_ONLY_IMMUTABLE = False
+    # In-process cache of GET responses, see cache.py. Set RESPONSE_CACHE to False to turn it off.
+    RESPONSE_CACHE = True
+    RESPONSE_CACHE_MAX_ENTRIES = 1024
+    RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+    RESPONSE_CACHE_TTL = 300
+    # Serve the region and event GET routes from a read-only copy of the tables in memory, see snapshot.py. Changes
+    # made by other processes are seen after at most SNAPSHOT_CHECK_INTERVAL seconds.
+    SNAPSHOT = False
+    SNAPSHOT_CHECK_INTERVAL = 1.0
+    # Add a Server-Timing header to each response and count the requests, queries and time for each route for
+    # /metrics, see metrics.py
+    METRICS = False
+    # Async mode, see asgi.py: most region and event queries run at the same time, and the seconds a request waits
+    # for one of them before a 503 response is returned
+    ASYNC_MAX_CONCURRENCY = 32
+    ASYNC_QUEUE_TIMEOUT = 10.0
+
+
+class ProductionConfig(DevelopmentConfig):
+    """Settings for running the app with several threads and/or worker processes."""
+    SQLALCHEMY_ECHO = False
+    # Each thread uses its own connection from the pool; 'timeout' is how long a writer waits for the file lock
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_recycle": 3600,
+        "connect_args": {"timeout": 15, "check_same_thread": False},
+    }
+    # WAL lets readers continue while a write is in progress, with synchronous=NORMAL WAL is still safe after a
+    # crash. mmap_size is in bytes, a negative cache_size is in KiB.
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,
+        "cache_size": -65536,
+        "temp_store": "MEMORY",
+    }
+    SQLITE_READ_ONLY_ENGINE = True
+    METRICS = True
+
+
+configs = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+}
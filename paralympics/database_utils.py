@@ -1,15 +1,44 @@
-# Different options for creating the database and adding data to the database
+# Creating the database and adding data to the database
 import csv
+import hashlib
+import json
 import sqlite3
-import pandas as pd
+import time
+from datetime import date
 from pathlib import Path
 
+from sqlalchemy import Text, and_, bindparam, delete, insert, text, tuple_, type_coerce, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.schema import CreateIndex
+
 from paralympics import Region, Event
+from paralympics.batch import referencing_columns
+from paralympics.cache import bump_table_versions
+from paralympics.search import create_search_index
+from paralympics.stats import refresh_stats
+from paralympics.models import SCHEMA_VERSION, Medal, RowHash, SourceFile
+from paralympics.schemas import parse_date
 
 # File locations
 db_file = Path(__file__).parent.joinpath("paralympics.sqlite")
 region_file = Path(__file__).parent.parent.joinpath("data", "noc_regions.csv")
 event_file = Path(__file__).parent.parent.joinpath("data", "paralympic_events.csv")
+medal_file = Path(__file__).parent.parent.joinpath("data", "medals.xlsx")
+
+# Number of rows sent to the database in each executemany() call
+BATCH_SIZE = 1000
+
+# Natural key used to match the rows in each CSV file to the rows in the database when syncing
+REGION_KEY = ["NOC"]
+EVENT_KEY = ["type", "year"]
+
+# Columns of the medal table for each heading in the medals workbook. The workbook has a 'Summer' and a 'Winter' sheet;
+# the 'Total' sheet is the sum of the other two so it is not loaded.
+MEDAL_COLUMNS = {"Team": "team", "Code": "NOC", "Number": "games", "Gold": "gold", "Silver": "silver",
+                 "Bronze": "bronze", "Total": "total"}
+MEDAL_SHEETS = {"Summer": "summer", "Winter": "winter"}
+# Codes in the workbook that are not the NOC code (a footnote marker was copied into the code for China)
+MEDAL_CODE_FIXES = {")[a": "CHN"}
 
 
 def create_db_if_not_exist(db_file):
@@ -67,152 +96,553 @@ def create_db_if_not_exist(db_file):
     connection.commit()
 
 
-def add_data_pandas(region_file, event_file):
+def get_schema_version(db):
+    """Returns the schema version saved in the SQLite database file header (PRAGMA user_version).
+
+    Reading the pragma does not read any tables, so this is cheap enough to run when the app handles its first
+    request.
+
+    :param db: SQLAlchemy database for the app
+    :return: int, 0 if the database has not been created with init_db
     """
-    Version that adds data to the database using pandas DataFrame methods.
+    return db.session.execute(text("PRAGMA user_version")).scalar()
+
+
+def migrate_event_dates(db):
+    """Schema version 5: converts event start and end dates from text such as 'dd/mm/yyyy' or '18-Sep-60' to
+    'YYYY-MM-DD'.
 
-    pandas.to_csv() can also create the database tables, however this will use the columns as defined in the
-    DataFrame which may not match what you want for the database.
-    :param event_file: csv file with teh event data
-    :param region_file: csv file with the region data
+    The values are converted with parse_date, using the event's year for two-digit years. Values that are not a date
+    are set to NULL, as the Date column cannot read them. Each change that is not from dd/mm/yyyy is printed.
+
+    :param db: SQLAlchemy database for the app
     """
-    # 1. Create a SQLite database engine that connects to the database file
-    connection = sqlite3.connect(db_file)
+    table = Event.__table__
+    for column in (table.c.start, table.c.end):
+        # Read the values as text, the Date type would raise ValueError for the values that are not ISO dates
+        value = type_coerce(column, Text)
+        rows = db.session.execute(db.select(table.c.id, table.c.year, value.label("value"))
+                                  .where(value.is_not(None))).all()
+        changes = []
+        for row in rows:
+            try:
+                new_value = parse_date(row.value, row.year)
+            except ValueError:
+                new_value = None
+            if new_value is not None and new_value.isoformat() == row.value:
+                continue
+            changes.append({"event_id": row.id, "new_value": new_value})
+            if new_value is None:
+                print(f"Event {row.id} {column.name} '{row.value}' is not a date, set to NULL")
+            elif not (len(row.value) == 10 and row.value[2] == "/" and row.value[5] == "/"):
+                print(f"Event {row.id} {column.name} '{row.value}' changed to {new_value.isoformat()}")
+        if changes:
+            statement = (update(table).where(table.c.id == bindparam("event_id"))
+                         .values({column: bindparam("new_value", type_=column.type)}))
+            execute_in_batches(db, statement, changes)
+        print(f"Changed {len(changes)} event {column.name} values to YYYY-MM-DD or NULL")
+
+
+def migrate_search_index(db):
+    """Schema version 6: creates the full-text search tables and triggers, see search.py
 
-    # 2. Import data from CSV to database table using pandas read_csv
-    # First count the existing rows in the region, only add data if there are 0 rows
-    num = connection.cursor().execute("SELECT COUNT(*) FROM region")
-    count = num.fetchone()[0]
-    if count == 0:
-        # Read the noc_regions data to a pandas dataframe
-        na_values = [""]
-        regions_df = pd.read_csv(region_file, keep_default_na=False, na_values=na_values)
+    :param db: SQLAlchemy database for the app
+    """
+    create_search_index(db.session.connection())
 
-        # 3. Write the pandas DataFrame contents to the database tables
-        # For the region table we do not want the pandas DataFrame index column
-        regions_df.to_sql("region", connection, if_exists="append", index=False)
 
-    # Count the existing rows in event table, only add data if there are 0 rows
-        num = connection.cursor().execute("SELECT COUNT(*) FROM event")
-        count = num.fetchone()[0]
-        if count == 0:
-            # Read the paralympics event data to a pandas dataframe
-            events_df = pd.read_csv(event_file)
+# Changes to the data in existing tables, as (schema version, function), run by init_db in version order
+MIGRATIONS = [
+    (5, migrate_event_dates),
+    (6, migrate_search_index),
+]
 
-            # 3. Write the pandas DataFrame contents to the database tables
-            # For the event table we want the pandas index, but it needs to start from 1 and not 0
-            events_df.index += 1
-            events_df.to_sql("event", connection, if_exists="append", index_label='id')
 
-    # 4. Close the database connection
-    connection.close()
+def init_db(db):
+    """Creates any tables and indexes that do not exist and saves the current schema version in the database.
 
+    create_all does not update tables if they are already in the database, so indexes added to the models after
+    the table was created are created separately.
 
-def add_data_csv(db_file, region_file, event_file):
-    """Add data using sqlite3 to make the connection and csv to read the data
+    :param db: SQLAlchemy database for the app
+    """
+    current_version = get_schema_version(db)
+    db.create_all()
+    # Update the data in existing tables for the schema versions after the database's version
+    for version, migrate in MIGRATIONS:
+        if current_version < version:
+            migrate(db)
+    # IF NOT EXISTS rather than checkfirst, as SQLAlchemy cannot find indexes on expressions in the database
+    for table in db.metadata.sorted_tables:
+        for index in table.indexes:
+            db.session.execute(CreateIndex(index, if_not_exists=True))
+    # Calculate the summary tables, in case they are new
+    refresh_stats(db.session.connection())
+    db.session.execute(text(f"PRAGMA user_version = {int(SCHEMA_VERSION)}"))
+    db.session.commit()
+
+
+def explain_query_plan(db, statement):
+    """Returns the steps SQLite will use to run a query, from EXPLAIN QUERY PLAN.
 
-    Only add the data if it doesn't exist.
-    :param db_file: database file
-    :param region_file: csv file with the region data
-    :param event_file: csv file with the event data
+    :param db: SQLAlchemy database for the app
+    :param statement: SQLAlchemy select statement
+    :return: list of strings, e.g. ['SEARCH event USING INDEX ix_event_type_year (type=? AND year=?)']
     """
-    # 1. Create a SQLite database engine that connects to the database file
-    connection = sqlite3.connect(db_file)
+    compiled = statement.compile(db.engine, compile_kwargs={"literal_binds": True})
+    rows = db.session.execute(text(f"EXPLAIN QUERY PLAN {compiled}")).all()
+    return [row.detail for row in rows]
+
+
+def assert_uses_index(db, statement, index_name):
+    """Raises AssertionError if SQLite would not use the named index to run the query.
+
+    :param db: SQLAlchemy database for the app
+    :param statement: SQLAlchemy select statement
+    :param index_name: name of the index, e.g. 'ix_event_type_year'
+    """
+    plan = explain_query_plan(db, statement)
+    if not any(f"USING INDEX {index_name}" in step or f"USING COVERING INDEX {index_name}" in step
+               for step in plan):
+        raise AssertionError(f"Query does not use {index_name}: {statement}\nQuery plan: {plan}")
+
+
+# Requests to the filter endpoints, each with the index its query should use
+INDEX_CHECK_REQUESTS = [
+    ("/events?type=summer", "ix_event_type_id"),
+    ("/events?type=summer&after=10", "ix_event_type_id"),
+    ("/events?type=winter&year_from=1990&year_to=2010", "ix_event_type_year"),
+    ("/events?NOC=GBR", "ix_event_NOC_id"),
+    ("/events?NOC=GBR&year_from=2000", "ix_event_NOC_year"),
+    ("/events?from=2012-01-01&to=2012-12-31", "ix_event_start_end"),
+    ("/medals?type=summer", "ix_medal_type_rank"),
+]
+
+
+def index_check_queries(app):
+    """Returns the queries the event filter and medal table endpoints run for INDEX_CHECK_REQUESTS, each with the
+    index it should use.
+
+    The queries are made by the same functions as the routes, in a test request context, so they have the same
+    filters, ORDER BY and LIMIT as the endpoints.
+
+    :param app: the Flask app
+    :return: list of (URL, select statement, index name)
+    """
+    from paralympics.paralympics import events_query, medals_query
+
+    queries = []
+    for url, index_name in INDEX_CHECK_REQUESTS:
+        with app.test_request_context(url):
+            if url.startswith("/events"):
+                statement = events_query()[0]
+            else:
+                statement = medals_query()
+        queries.append((url, statement, index_name))
+    return queries
+
+
+def check_query_plans(db, app):
+    """Checks that the query of each of the event filter and medal table endpoints uses its index, raises
+    AssertionError if not.
+
+    :param db: SQLAlchemy database for the app
+    :param app: the Flask app
+    """
+    for _url, statement, index_name in index_check_queries(app):
+        assert_uses_index(db, statement, index_name)
+
+
+def column_converters(model, header):
+    """Works out, once per file, how to convert each CSV value to the type of the matching model column.
+
+    Empty strings become None. Integer columns are converted with int(), date columns with parse_date(), all other
+    columns are kept as text. CSV columns that are not in the model are ignored.
+
+    :param model: SQLAlchemy model class, e.g. Event
+    :param header: list of column names from the first row of the CSV file
+    :return: list of (index of the value in the CSV row, column name, converter function)
+    """
+    columns = model.__table__.columns
+    converters = []
+    for index, name in enumerate(header):
+        name = name.strip()
+        if name not in columns:
+            continue
+        python_type = columns[name].type.python_type
+        if python_type is int:
+            converters.append((index, name, int))
+        elif python_type is date:
+            converters.append((index, name, parse_date))
+        else:
+            converters.append((index, name, str))
+    return converters
+
+
+def read_csv_rows(csv_file, model):
+    """Streams a CSV file and yields one dictionary per row with the values converted for the model columns.
+
+    The file is read one line at a time so memory use does not depend on the size of the file. 'utf-8-sig' removes
+    the byte order mark that Excel adds to the start of the event file.
+
+    :param csv_file: Path to the CSV file, the first row must have the column names
+    :param model: SQLAlchemy model class the rows will be inserted into
+    """
+    with open(csv_file, 'r', encoding='utf-8-sig', newline='') as file:
+        csv_reader = csv.reader(file)
+        converters = column_converters(model, next(csv_reader))
+        for row in csv_reader:
+            yield {name: (convert(row[index]) if row[index] != '' else None)
+                   for index, name, convert in converters}
 
-    # 2. Create a cursor object to execute SQL queries
-    cursor = connection.cursor()
 
-    # 3. Import data from CSV and write to database table
-    # First count the existing rows, only add data if there are 0 rows
-    num = cursor.execute("SELECT COUNT(*) FROM region")
-    count = num.fetchone()[0]
-    if count == 0:
-        # open the csv file using csv.reader and execute the sql using sqlite3 cursor
-        with open(region_file, 'r') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header row
-            sql = "INSERT INTO region values(?, ?, ?)"
-            for row in csv_reader:
-                for i in range(len(row)):
-                    if row[i] == '':
-                        row[i] = None
-                cursor.execute(sql, row)
-            connection.commit()
-
-    # First check if there are any existing rows, only add data if there are 0 rows
-    num = cursor.execute("SELECT count(*) FROM event")
-    count = num.fetchone()[0]
-    if count == 0:
-        with (open(event_file, 'r') as file):
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header row
-            sql = ("INSERT INTO event (type, year, country, host, NOC, start, end, duration, disabilities_included, "
-                   "events, sports, countries, participants_m, participants_f, participants, highlights) VALUES (?, ?, ?, "
-                   "?, ?, ?, ?, ?, ?, ? ,?, ?, ?, ?, ?, ?)")
-            for row in csv_reader:
-                for i in range(len(row)):
-                    if row[i] == '':
-                        row[i] = None
-                cursor.execute(sql, row)
-            connection.commit()
-
-    # 8. Close the database connection
-    connection.close()
-
-def add_data(db):
+def execute_in_batches(db, statement, rows, batch_size=BATCH_SIZE):
+    """Executes a statement once per batch of rows (executemany) on the session's connection.
+
+    :param db: SQLAlchemy database for the app
+    :param statement: SQLAlchemy Core statement, e.g. insert(table)
+    :param rows: iterable of dictionaries with the parameters for the statement
+    :param batch_size: number of rows sent to the database in each executemany() call
+    :return: number of rows executed
+    """
+    connection = db.session.connection()
+    count = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == batch_size:
+            connection.execute(statement, batch)
+            count += len(batch)
+            batch = []
+    if batch:
+        connection.execute(statement, batch)
+        count += len(batch)
+    return count
+
+
+def bulk_insert(db, model, rows, batch_size=BATCH_SIZE):
+    """Inserts rows in batches using a single INSERT statement per batch (executemany).
+
+    This does not create ORM objects, so there is no identity map or unit of work overhead for each row. The rows
+    are added in the current transaction, the caller is responsible for calling commit().
+
+    :param db: SQLAlchemy database for the app
+    :param model: SQLAlchemy model class
+    :param rows: iterable of dictionaries with column names as keys
+    :param batch_size: number of rows sent to the database in each executemany() call
+    :return: number of rows inserted
+    """
+    return execute_in_batches(db, insert(model.__table__), rows, batch_size)
+
+
+def bulk_upsert(db, model, rows, key_columns, batch_size=BATCH_SIZE):
+    """Inserts rows, or updates the existing row with the same key, using SQLite INSERT ... ON CONFLICT DO UPDATE.
+
+    :param db: SQLAlchemy database for the app
+    :param model: SQLAlchemy model class
+    :param rows: list of dictionaries with column names as keys, all with the same keys
+    :param key_columns: list of column names with a primary key or unique constraint
+    :param batch_size: number of rows sent to the database in each executemany() call
+    :return: number of rows inserted or updated
+    """
+    if not rows:
+        return 0
+    statement = sqlite_insert(model.__table__)
+    update_columns = {name: statement.excluded[name] for name in rows[0] if name not in key_columns}
+    statement = statement.on_conflict_do_update(index_elements=key_columns, set_=update_columns)
+    return execute_in_batches(db, statement, rows, batch_size)
+
+
+def row_key(row, key_columns):
+    """Returns the natural key of a row from a CSV file as a JSON list, the key of its RowHash, e.g. '["GBR"]'"""
+    return json.dumps([row[name] for name in key_columns])
+
+
+def row_hash(row):
+    """Returns the sha256 of the values of a row from a CSV file, saved in RowHash to find the rows that change."""
+    return hashlib.sha256(repr(tuple(row.values())).encode()).hexdigest()
+
+
+def hash_rows(rows, table_name, key_columns, hashes):
+    """Yields the rows unchanged, adding the RowHash values for each row to the hashes list.
+
+    :param rows: iterable of dictionaries from read_csv_rows()
+    :param table_name: name of the table the rows are for
+    :param key_columns: list of column names that identify a row
+    :param hashes: list the RowHash dictionaries are added to
+    """
+    for row in rows:
+        hashes.append({"table_name": table_name, "key": row_key(row, key_columns), "hash": row_hash(row)})
+        yield row
+
+
+def load_csv(db, model, csv_file, batch_size=BATCH_SIZE, key_columns=None):
+    """Loads a CSV file into the table for a model and prints the load rate in rows/sec.
+
+    If key_columns are given, the fingerprint of the file and the hash of each row are saved as well, so that the
+    next sync_data only writes the rows that have changed since.
+
+    :param db: SQLAlchemy database for the app
+    :param model: SQLAlchemy model class
+    :param csv_file: Path to the CSV file
+    :param batch_size: number of rows sent to the database in each executemany() call
+    :param key_columns: list of column names that identify a row, e.g. REGION_KEY
+    :return: number of rows inserted
+    """
+    start = time.perf_counter()
+    table_name = model.__tablename__
+    rows = read_csv_rows(csv_file, model)
+    hashes = []
+    if key_columns:
+        rows = hash_rows(rows, table_name, key_columns, hashes)
+    count = bulk_insert(db, model, rows, batch_size)
+    if key_columns:
+        bulk_upsert(db, RowHash, hashes, ["table_name", "key"], batch_size)
+        bulk_upsert(db, SourceFile, [{"table_name": table_name, "fingerprint": file_fingerprint(csv_file)}],
+                    ["table_name"])
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float(count)
+    print(f"Added {count} rows to {table_name} in {elapsed:.3f}s ({rate:.0f} rows/sec)")
+    return count
+
+
+def read_medal_rows(xlsx_file):
+    """Generator that yields one dictionary per team and type from the medals workbook.
+
+    The workbook is opened in read-only mode, which reads the rows from the file as they are iterated instead of
+    loading every cell into memory first. The last row of each sheet is the total for all teams, which has no code,
+    so it is skipped.
+
+    :param xlsx_file: Path to the .xlsx file
+    :return: generator of dictionaries with the Medal column names as keys
+    """
+    # openpyxl is only needed to load the medals, so it is not imported when the app starts
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(xlsx_file, read_only=True, data_only=True)
+    try:
+        for sheet_name, medal_type in MEDAL_SHEETS.items():
+            rows = workbook[sheet_name].iter_rows(values_only=True)
+            columns = [MEDAL_COLUMNS[heading] for heading in next(rows)]
+            for values in rows:
+                row = dict(zip(columns, values))
+                if not row["NOC"]:
+                    continue
+                row["NOC"] = MEDAL_CODE_FIXES.get(row["NOC"], row["NOC"])
+                # Some team names end with a non-breaking space
+                row["team"] = row["team"].strip()
+                row["type"] = medal_type
+                yield row
+    finally:
+        # Read-only workbooks keep the file open until they are closed
+        workbook.close()
+
+
+def load_medals(db, xlsx_file=medal_file, batch_size=BATCH_SIZE):
+    """Loads the medals workbook into the medal table and prints the load rate in rows/sec.
+
+    :param db: SQLAlchemy database for the app
+    :param xlsx_file: Path to the .xlsx file
+    :param batch_size: number of rows sent to the database in each executemany() call
+    :return: number of rows inserted
+    """
+    start = time.perf_counter()
+    count = bulk_insert(db, Medal, read_medal_rows(xlsx_file), batch_size)
+    elapsed = time.perf_counter() - start
+    rate = count / elapsed if elapsed > 0 else float(count)
+    print(f"Added {count} rows to {Medal.__tablename__} in {elapsed:.3f}s ({rate:.0f} rows/sec)")
+    return count
+
+
+def add_data(db, region_csv=region_file, event_csv=event_file, medal_xlsx=medal_file):
     """Adds data to the database if it does not already exist.
 
-    This method uses db which is the FlaskSQLALchemy instance for the app
-
-    :param db: SQLAlchemy database for the app
-    """
-
-    # If there are no regions in the database, then add them
-    first_region = db.session.execute(db.select(Region)).first()
-    if not first_region:
-        print("Start adding region data to the database")
-        noc_file = Path(__file__).parent.parent.joinpath("data", "noc_regions.csv")
-        with open(noc_file, 'r') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header row
-            for row in csv_reader:
-                # row[0] is the first column, row[1] is the second column
-                r = Region(NOC=row[0], region=row[1], notes=row[2])
-                db.session.add(r)
-            db.session.commit()
-
-    # If there are no Events, then add them
-    first_event = db.session.execute(db.select(Event)).first()
-    if not first_event:
-        print("Start adding event data to the database")
-        event_file = Path(__file__).parent.parent.joinpath("data", "paralympic_events.csv")
-        with open(event_file, 'r') as file:
-            csv_reader = csv.reader(file)
-            next(csv_reader)  # Skip header row
-            for row in csv_reader:
-                # row[0] is the first column, row[1] is the second column etc
-                e = Event(type=row[0],
-                          year=row[1],
-                          country=row[2],
-                          host=row[3],
-                          NOC=row[4],
-                          start=row[5],
-                          end=row[6],
-                          duration=row[7] or None,
-                          disabilities_included=row[8],
-                          countries=row[9] or None,
-                          events=row[10] or None,
-                          sports=row[11] or None,
-                          participants_m=row[12] or None,
-                          participants_f=row[13] or None,
-                          participants=row[14] or None,
-                          highlights=row[15])
-                db.session.add(e)
-            db.session.commit()
+    This method uses db which is the FlaskSQLALchemy instance for the app. All the files are loaded in a single
+    transaction, so either all the data is added or, if there is an error, none of it is.
+
+    :param db: SQLAlchemy database for the app
+    :param region_csv: Path to the regions CSV file, e.g. a generated file for the benchmarks
+    :param event_csv: Path to the events CSV file
+    :param medal_xlsx: Path to the medals workbook
+    """
+    try:
+        changed = set()
+        # If there are no regions in the database, then add them
+        first_region = db.session.execute(db.select(Region.NOC).limit(1)).first()
+        if not first_region:
+            print("Start adding region data to the database")
+            load_csv(db, Region, region_csv, key_columns=REGION_KEY)
+            changed.add(Region.__tablename__)
+
+        # If there are no Events, then add them
+        first_event = db.session.execute(db.select(Event.id).limit(1)).first()
+        if not first_event:
+            print("Start adding event data to the database")
+            load_csv(db, Event, event_csv, key_columns=EVENT_KEY)
+            changed.add(Event.__tablename__)
+
+        # If there are no medals, then add them
+        first_medal = db.session.execute(db.select(Medal.NOC).limit(1)).first()
+        if not first_medal:
+            print("Start adding medal data to the database")
+            load_medals(db, medal_xlsx)
+            changed.add(Medal.__tablename__)
+
+        # The rows are inserted without the ORM, so update the summary tables and tell the response cache the tables
+        # have changed
+        if Event.__tablename__ in changed:
+            refresh_stats(db.session.connection())
+        if changed:
+            bump_table_versions(db.session.connection(), changed)
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def file_fingerprint(csv_file):
+    """Returns the sha256 of the contents of a file, read in chunks so large files are not loaded into memory.
+
+    :param csv_file: Path to the file
+    :return: hex digest
+    """
+    digest = hashlib.sha256()
+    with open(csv_file, 'rb') as file:
+        for chunk in iter(lambda: file.read(65536), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def keys_in_use(db, table, key_columns, keys):
+    """Returns the keys of the rows that rows in other tables refer to, e.g. the regions that have events or medals.
+
+    :param db: SQLAlchemy database for the app
+    :param table: SQLAlchemy Table
+    :param key_columns: list of column names that identify a row
+    :param keys: natural keys of the rows to check, as JSON lists from row_key()
+    :return: set of the keys that are in use
+    """
+    columns = [table.c[name] for name in key_columns]
+    in_use = set()
+    # SQLite allows a limited number of parameters in one statement
+    step = 500 // len(columns)
+    for foreign_key_column, referenced_column in referencing_columns(table):
+        refers = db.select(foreign_key_column).where(foreign_key_column == referenced_column).exists()
+        for start in range(0, len(keys), step):
+            values = [tuple(json.loads(key)) for key in keys[start:start + step]]
+            rows = db.session.execute(db.select(*columns).where(tuple_(*columns).in_(values), refers))
+            in_use.update(json.dumps(list(row)) for row in rows)
+    return in_use
+
+
+def sync_csv(db, model, csv_file, key_columns, batch_size=BATCH_SIZE):
+    """Applies the changes in a CSV file to the table for a model.
+
+    If the fingerprint of the file matches the last sync then nothing is read. Otherwise, the hash of each row is
+    compared with the hash saved by the last sync and only the rows that are new or changed are written, using an
+    UPSERT on the natural key. Rows that were in the file at the last sync but have since been removed are deleted.
+    Rows that were added to the table by other means (e.g. the REST API) are not deleted, nor are rows that other
+    tables refer to.
+
+    The changes are made in the current transaction, the caller is responsible for calling commit().
+
+    :param db: SQLAlchemy database for the app
+    :param model: SQLAlchemy model class
+    :param csv_file: Path to the CSV file
+    :param key_columns: list of column names that identify a row, these must have a unique constraint
+    :param batch_size: number of rows sent to the database in each executemany() call
+    :return: dictionary with the number of rows inserted, updated, deleted and kept (not deleted as other tables
+        refer to them)
+    """
+    table_name = model.__tablename__
+    counts = {"inserted": 0, "updated": 0, "deleted": 0, "kept": 0}
+
+    fingerprint = file_fingerprint(csv_file)
+    source = db.session.get(SourceFile, table_name)
+    if source is not None and source.fingerprint == fingerprint:
+        print(f"{Path(csv_file).name} has not changed since the last sync of {table_name}")
+        return counts
+
+    known = dict(db.session.execute(
+        db.select(RowHash.key, RowHash.hash).filter_by(table_name=table_name)
+    ).all())
+
+    # Find the new and changed rows
+    changed_rows = []
+    changed_hashes = []
+    seen = set()
+    for row in read_csv_rows(csv_file, model):
+        key = row_key(row, key_columns)
+        seen.add(key)
+        new_hash = row_hash(row)
+        previous_hash = known.get(key)
+        if previous_hash == new_hash:
+            continue
+        counts["inserted" if previous_hash is None else "updated"] += 1
+        changed_rows.append(row)
+        changed_hashes.append({"table_name": table_name, "key": key, "hash": new_hash})
+
+    bulk_upsert(db, model, changed_rows, key_columns, batch_size)
+    bulk_upsert(db, RowHash, changed_hashes, ["table_name", "key"], batch_size)
+
+    # Delete the rows that are no longer in the file. Rows that other tables still refer to, e.g. a region that has
+    # events, are kept along with their hash, so they are deleted by a later sync once nothing refers to them.
+    table = model.__table__
+    removed = [key for key in known if key not in seen]
+    in_use = keys_in_use(db, table, key_columns, removed)
+    if in_use:
+        removed = [key for key in removed if key not in in_use]
+        counts["kept"] = len(in_use)
+        print(f"Kept {len(in_use)} rows of {table_name} that are not in {Path(csv_file).name} as other tables refer "
+              f"to them: {', '.join(sorted(in_use))}")
+    if removed:
+        delete_rows = delete(table).where(and_(*[table.c[name] == bindparam(f"key_{name}") for name in key_columns]))
+        execute_in_batches(db, delete_rows,
+                           ({f"key_{name}": value for name, value in zip(key_columns, json.loads(key))}
+                            for key in removed), batch_size)
+        hashes = RowHash.__table__
+        delete_hashes = delete(hashes).where(hashes.c.table_name == table_name, hashes.c.key == bindparam("key_value"))
+        execute_in_batches(db, delete_hashes, ({"key_value": key} for key in removed), batch_size)
+        counts["deleted"] = len(removed)
+
+    bulk_upsert(db, SourceFile, [{"table_name": table_name, "fingerprint": fingerprint}], ["table_name"])
+    print(f"Synced {table_name}: {counts['inserted']} inserted, {counts['updated']} updated, "
+          f"{counts['deleted']} deleted")
+    return counts
+
+
+def sync_data(db, region_csv=region_file, event_csv=event_file):
+    """Applies any changes in the region and event CSV files to the database in a single transaction.
+
+    Unlike add_data this can be run against a database that already has data, only the rows that have changed since
+    the last sync, or since the data was added by add_data, are written.
+
+    :param db: SQLAlchemy database for the app
+    :param region_csv: Path to the regions CSV file
+    :param event_csv: Path to the events CSV file
+    :return: dictionary of table name: the counts returned by sync_csv
+    """
+    try:
+        changed = set()
+        results = {}
+        for model, csv_file, key_columns in ((Region, region_csv, REGION_KEY), (Event, event_csv, EVENT_KEY)):
+            counts = sync_csv(db, model, csv_file, key_columns)
+            results[model.__tablename__] = counts
+            if counts["inserted"] or counts["updated"] or counts["deleted"]:
+                changed.add(model.__tablename__)
+        # The rows are written without the ORM, so update the summary tables and tell the response cache the tables
+        # have changed
+        if Event.__tablename__ in changed:
+            refresh_stats(db.session.connection())
+        if changed:
+            bump_table_versions(db.session.connection(), changed)
+        db.session.commit()
+        return results
+    except Exception:
+        db.session.rollback()
+        raise
 
 
 # if __name__ == '__main__':
     # Add code here if you want to run it as a one off
     # create_db_if_not_exist(db_file)
-    # add_data_csv(region_file=region_file, event_file=event_file, db_file=db_file)
-    # add_data_pandas(region_file=region_file, event_file=event_file)
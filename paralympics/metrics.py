@@ -0,0 +1,188 @@
+# Request timing and counts for each route, turned on with METRICS = True in config.py
+#
+# For each request this records the number of SQL statements and the time spent running them (SQLAlchemy
+# before/after_cursor_execute events), the time spent converting the results to JSON, the total time and the size of
+# the response. The times for the request are returned in a Server-Timing header, which browser developer tools show
+# in the network timings, and the totals for each route are returned by /metrics in the Prometheus text format.
+# https://developer.mozilla.org/en-US/docs/Web/HTTP/Headers/Server-Timing
+# https://prometheus.io/docs/instrumenting/exposition_formats/
+#
+# The totals are kept in memory in each process, so with several worker processes each /metrics response only has
+# the requests handled by the process that answered it.
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+
+from flask import g, request, request_finished, request_started
+from sqlalchemy import event
+
+from paralympics import db
+
+# Upper bounds, in seconds, of the request duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class RequestMetrics:
+    """Timings for the request being handled, kept in flask.g."""
+    __slots__ = ("start", "queries", "db_time", "serialize_time", "serialize_depth")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serialize_depth = 0
+
+
+class MetricsRegistry:
+    """Totals for each method, route and status code, since the process started."""
+
+    def __init__(self):
+        self._routes = {}
+        self._lock = threading.Lock()
+
+    def record(self, labels, metrics, duration, size):
+        """Adds a finished request to the totals for its labels.
+
+        :param labels: tuple of (method, route, status)
+        :param metrics: RequestMetrics for the request
+        :param duration: seconds taken to handle the request
+        :param size: response body size in bytes
+        """
+        with self._lock:
+            totals = self._routes.get(labels)
+            if totals is None:
+                totals = self._routes[labels] = {"requests": 0, "queries": 0, "db_seconds": 0.0,
+                                                 "serialize_seconds": 0.0, "response_bytes": 0,
+                                                 "duration_sum": 0.0, "buckets": [0] * len(DURATION_BUCKETS)}
+            totals["requests"] += 1
+            totals["queries"] += metrics.queries
+            totals["db_seconds"] += metrics.db_time
+            totals["serialize_seconds"] += metrics.serialize_time
+            totals["response_bytes"] += size
+            totals["duration_sum"] += duration
+            for index, bound in enumerate(DURATION_BUCKETS):
+                if duration <= bound:
+                    totals["buckets"][index] += 1
+
+    def prometheus_text(self):
+        """Returns the totals in the Prometheus text exposition format."""
+        with self._lock:
+            routes = sorted((labels, dict(totals, buckets=list(totals["buckets"])))
+                            for labels, totals in self._routes.items())
+        lines = []
+        counters = (
+            ("requests", "paralympics_requests_total", "Requests handled"),
+            ("queries", "paralympics_db_queries_total", "SQL statements run"),
+            ("db_seconds", "paralympics_db_seconds_total", "Time spent running SQL statements"),
+            ("serialize_seconds", "paralympics_serialize_seconds_total", "Time spent converting results to JSON"),
+            ("response_bytes", "paralympics_response_bytes_total", "Size of the response bodies"),
+        )
+        for key, name, description in counters:
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} counter")
+            for labels, totals in routes:
+                lines.append(f"{name}{{{format_labels(labels)}}} {totals[key]}")
+
+        name = "paralympics_request_duration_seconds"
+        lines.append(f"# HELP {name} Time taken to handle the request")
+        lines.append(f"# TYPE {name} histogram")
+        for labels, totals in routes:
+            label_text = format_labels(labels)
+            for bound, count in zip(DURATION_BUCKETS, totals["buckets"]):
+                lines.append(f'{name}_bucket{{{label_text},le="{bound}"}} {count}')
+            lines.append(f'{name}_bucket{{{label_text},le="+Inf"}} {totals["requests"]}')
+            lines.append(f"{name}_sum{{{label_text}}} {totals['duration_sum']}")
+            lines.append(f"{name}_count{{{label_text}}} {totals['requests']}")
+        return "\n".join(lines) + "\n"
+
+
+def format_labels(labels):
+    """Returns the method, route and status labels of a metric, e.g. method="GET",route="/events",status="200" """
+    method, route, status = labels
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}",status="{status}"'
+
+
+def current_metrics():
+    """Returns the RequestMetrics for the request being handled, or None if metrics are off or there is no request."""
+    return g.get("_request_metrics") if g else None
+
+
+@contextmanager
+def serialization_timer():
+    """Context manager that adds the time taken by the block to the request's serialization time.
+
+    Blocks inside another timed block are not counted twice.
+    """
+    metrics = current_metrics()
+    if metrics is None:
+        yield
+        return
+    metrics.serialize_depth += 1
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.serialize_depth -= 1
+        if metrics.serialize_depth == 0:
+            metrics.serialize_time += time.perf_counter() - start
+
+
+# The start time is kept on the statement's execution context rather than the connection, as after_cursor_execute is
+# not called if the statement raises an error, and the context is thrown away with the statement.
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if context is not None:
+        context.metrics_query_start = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "metrics_query_start", None)
+    metrics = current_metrics()
+    if metrics is not None:
+        metrics.queries += 1
+        if start is not None:
+            metrics.db_time += time.perf_counter() - start
+
+
+def start_request(sender, **extra):
+    g._request_metrics = RequestMetrics()
+
+
+def finish_request(sender, response, **extra):
+    metrics = g.pop("_request_metrics", None)
+    if metrics is None:
+        return
+    duration = time.perf_counter() - metrics.start
+    # Streamed responses are still being generated, so their size is not known and their queries are not counted
+    size = 0 if response.is_streamed else response.calculate_content_length() or 0
+    response.headers["Server-Timing"] = (f'db;dur={metrics.db_time * 1000:.2f};desc="{metrics.queries} queries", '
+                                         f"serialize;dur={metrics.serialize_time * 1000:.2f}, "
+                                         f"total;dur={duration * 1000:.2f}")
+    route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+    sender.extensions["metrics"].record((request.method, route, response.status_code), metrics, duration, size)
+
+
+def init_app(app):
+    """Turns on the metrics for an app: adds the event listeners and the registry used by /metrics.
+
+    :param app: the Flask app, after db.init_app(app)
+    """
+    app.extensions["metrics"] = MetricsRegistry()
+    with app.app_context():
+        for engine in db.engines.values():
+            event.listen(engine, "before_cursor_execute", before_cursor_execute)
+            event.listen(engine, "after_cursor_execute", after_cursor_execute)
+    request_started.connect(start_request, app)
+    request_finished.connect(finish_request, app)
+
+    # Time the JSON encoding of the dictionaries and lists returned by the routes
+    provider_response = app.json.response
+
+    @wraps(provider_response)
+    def timed_response(*args, **kwargs):
+        with serialization_timer():
+            return provider_response(*args, **kwargs)
+
+    app.json.response = timed_response
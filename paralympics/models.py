@@ -1,9 +1,13 @@
 # Adapted from https://flask-sqlalchemy.palletsprojects.com/en/3.1.x/quickstart/#define-models
+from datetime import date
 from typing import List
-from sqlalchemy import ForeignKey
+from sqlalchemy import ForeignKey, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from paralympics import db
 
+# Increase this when the models change. It is saved in the database by 'flask --app paralympics paralympics init-db'
+# and the app will not handle requests until the database has been updated to this version.
+SCHEMA_VERSION = 9
 
 # This uses the latest syntax for SQLAlchemy, older tutorials will show different syntax
 # SQLAlchemy provide an __init__ method for each model, so you do not need to declare this in your code
@@ -14,11 +18,24 @@ class Region(db.Model):
     notes: Mapped[str] = mapped_column(db.Text, nullable=True)
     # one-to-many relationship with Event, the relationship in Event is called 'region'
     # https://docs.sqlalchemy.org/en/20/orm/basic_relationships.html#one-to-many
-    events: Mapped[List["Event"]] = relationship(back_populates="region")
+    # passive_deletes stops the ORM setting Event.NOC to NULL, which is not allowed, when a region is deleted; the
+    # delete route checks that the region has no events first
+    events: Mapped[List["Event"]] = relationship(back_populates="region", passive_deletes=True)
 
 
 class Event(db.Model):
     __tablename__ = "event"
+    # Indexes for the columns the events are filtered on. database_utils.check_query_plans checks they are used.
+    # type and year are also the natural key for an event, used when the data is synced from the CSV file.
+    # The list routes order by id, so the (type, id) and (NOC, id) indexes return a filtered page in order without
+    # sorting all the matching rows.
+    __table_args__ = (
+        Index("ix_event_type_year", "type", "year", unique=True),
+        Index("ix_event_NOC_year", "NOC", "year"),
+        Index("ix_event_type_id", "type", "id"),
+        Index("ix_event_NOC_id", "NOC", "id"),
+        Index("ix_event_start_end", "start", "end"),
+    )
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
     type: Mapped[str] = mapped_column(db.Text, nullable=False)
     year: Mapped[int] = mapped_column(db.Integer, nullable=False)
@@ -28,8 +45,9 @@ class Event(db.Model):
     NOC: Mapped[str] = mapped_column(ForeignKey("region.NOC"))
     # add relationship to the parent table, Region, which has a relationship called 'events'
     region: Mapped["Region"] = relationship(back_populates="events")
-    start: Mapped[str] = mapped_column(db.Text, nullable=True)
-    end: Mapped[str] = mapped_column(db.Text, nullable=True)
+    # SQLAlchemy saves dates in SQLite as 'YYYY-MM-DD' text, which sorts in date order so it can be indexed
+    start: Mapped[date] = mapped_column(db.Date, nullable=True)
+    end: Mapped[date] = mapped_column(db.Date, nullable=True)
     duration: Mapped[int] = mapped_column(db.Integer, nullable=True)
     disabilities_included: Mapped[str] = mapped_column(db.Text, nullable=True)
     countries: Mapped[str] = mapped_column(db.Text, nullable=True)
@@ -42,6 +60,82 @@ class Event(db.Model):
     highlights: Mapped[str] = mapped_column(db.String, nullable=True)
 
 
+# Length of an event in days. The longest event is read from ix_event_days without reading the table, and is used by
+# the /events from and to filters to give the start date a lower bound, see paralympics.filter_events.
+EVENT_DAYS = func.julianday(Event.end) - func.julianday(Event.start)
+Index("ix_event_days", EVENT_DAYS)
+
+
+# Medals won by each team, loaded from data/medals.xlsx. The workbook has the total medals for each team over all the
+# Summer or all the Winter Games, so there is one row per NOC and type rather than one row per Games.
+class Medal(db.Model):
+    __tablename__ = "medal"
+    # The primary key starts with NOC so the medals for a region are found by the primary key index. The medal table
+    # for a type is read in order from ix_medal_type_rank (SQLite scans the index backwards for 'gold DESC').
+    __table_args__ = (
+        Index("ix_medal_type_rank", "type", "gold", "silver", "bronze"),
+    )
+    NOC: Mapped[str] = mapped_column(ForeignKey("region.NOC"), primary_key=True)
+    # 'summer' or 'winter', the same values as Event.type
+    type: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    team: Mapped[str] = mapped_column(db.Text, nullable=False)
+    # Number of Games of this type the team took part in
+    games: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    gold: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    silver: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    bronze: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    total: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    region: Mapped["Region"] = relationship()
+
+
+# The following two tables are used by database_utils.sync_data to find the rows that changed in the CSV files
+class SourceFile(db.Model):
+    __tablename__ = "source_file"
+    table_name: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    # sha256 of the contents of the CSV file the last time it was synced
+    fingerprint: Mapped[str] = mapped_column(db.Text, nullable=False)
+
+
+class RowHash(db.Model):
+    __tablename__ = "row_hash"
+    table_name: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    # natural key of the row as a JSON list, e.g. '["GBR"]' for a region or '["summer", 2012]' for an event
+    key: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    hash: Mapped[str] = mapped_column(db.Text, nullable=False)
+
+
+# Summary tables for the /stats routes, kept up to date from the event table by stats.py
+# One row per Games with the participant numbers and the number of events per sport
+class StatsYear(db.Model):
+    __tablename__ = "stats_year"
+    type: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    year: Mapped[int] = mapped_column(db.Integer, primary_key=True)
+    participants: Mapped[int] = mapped_column(db.Integer, nullable=True)
+    participants_m: Mapped[int] = mapped_column(db.Integer, nullable=True)
+    participants_f: Mapped[int] = mapped_column(db.Integer, nullable=True)
+    female_share: Mapped[float] = mapped_column(db.Float, nullable=True)
+    events: Mapped[int] = mapped_column(db.Integer, nullable=True)
+    sports: Mapped[int] = mapped_column(db.Integer, nullable=True)
+    events_per_sport: Mapped[float] = mapped_column(db.Float, nullable=True)
+
+
+# Number of Games hosted by each NOC
+class StatsHost(db.Model):
+    __tablename__ = "stats_host"
+    NOC: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    games: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    first_year: Mapped[int] = mapped_column(db.Integer, nullable=False)
+    last_year: Mapped[int] = mapped_column(db.Integer, nullable=False)
+
+
+# Version number for each table, increased in the same transaction as each change to the table (see cache.py), so the
+# response cache in every worker process can tell whether a cached response is still up to date
+class TableVersion(db.Model):
+    __tablename__ = "table_version"
+    table_name: Mapped[str] = mapped_column(db.Text, primary_key=True)
+    version: Mapped[int] = mapped_column(db.Integer, nullable=False)
+
+
 class User(db.Model):
     id: Mapped[int] = mapped_column(db.Integer, primary_key=True)
     email: Mapped[str] = mapped_column(db.String, unique=True, nullable=False)
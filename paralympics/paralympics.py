@@ -1,6 +1,855 @@
-from flask import current_app as app
+import zlib
+from bisect import bisect_right
+from functools import lru_cache
+from itertools import chain
+from operator import attrgetter
+
+from flask import abort, current_app as app, make_response, request, stream_with_context, url_for
+from marshmallow import ValidationError
+from sqlalchemy.exc import IntegrityError
+
+from paralympics import db, read_bind
+from paralympics.batch import MAX_BATCH_SIZE, apply_batch
+from paralympics.cache import cached
+from paralympics.metrics import serialization_timer
+from paralympics.models import EVENT_DAYS, Event, Medal, Region, StatsHost, StatsYear
+from paralympics.search import search
+from paralympics.schemas import RegionSchema, EventSchema, RegionWithEventsSchema, EventWithRegionSchema, parse_date
+from paralympics.serializers import compile_dumper, csv_lines, json_line, json_response
+
+# Flask-Marshmallow Schemas
+regions_schema = RegionSchema(many=True)
+region_schema = RegionSchema()
+events_schema = EventSchema(many=True)
+event_schema = EventSchema()
+
+# Compile the serializers used by the routes when nothing is included, see serializers.py
+compile_dumper(Region)
+compile_dumper(Event)
+
+# Number of items returned by the list routes if 'limit' is not given, and the most that can be requested
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Number of rows fetched from the database at a time by the export routes
+EXPORT_BATCH_SIZE = 1000
+
+# Relationships that can be added to the response with the 'include' query string argument. Each has the loader option
+# that loads the related rows for all the results in one extra query (selectinload) or in the same query (joinedload),
+# rather than one query per row, and the schema that dumps them as nested objects.
+REGION_INCLUDES = {"events": (db.selectinload(Region.events), RegionWithEventsSchema)}
+EVENT_INCLUDES = {"region": (db.joinedload(Event.region), EventWithRegionSchema)}
+
+
+def bad_request(message):
+    """Stops the request and returns a 400 response with a JSON message."""
+    abort(make_response({"message": message}, 400))
+
+
+def get_int_arg(name, default=None, minimum=None, maximum=None):
+    """Returns a query string argument as an int, or the default if it is not in the request.
+
+    :param name: name of the argument, e.g. 'limit' for /events?limit=10
+    :param default: value returned if the argument is not given
+    :param minimum: smallest value allowed
+    :param maximum: largest value allowed
+    """
+    value = request.args.get(name)
+    if value is None or value == '':
+        return default
+    try:
+        value = int(value)
+    except ValueError:
+        bad_request(f"'{name}' must be a whole number")
+    if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+        bad_request(f"'{name}' must be between {minimum} and {maximum}")
+    return value
+
+
+def get_date_arg(name):
+    """Returns a query string argument as a date, or None if it is not in the request.
+
+    :param name: name of the argument, e.g. 'from' for /events?from=2012-01-01
+    """
+    value = request.args.get(name)
+    if not value:
+        return None
+    try:
+        return parse_date(value)
+    except ValueError:
+        bad_request(f"'{name}' must be a date, use YYYY-MM-DD")
+
+
+@lru_cache(maxsize=128)
+def sparse_schema(schema_class, fields):
+    """Returns a schema that dumps only the given fields, cached so each fieldset only creates one schema.
+
+    :param schema_class: Marshmallow schema class, e.g. EventSchema
+    :param fields: tuple of field names, or None for all fields
+    """
+    return schema_class(many=True, only=fields)
+
+
+def get_includes(includes, schema_class):
+    """Returns the loader options and schema for the relationships requested with 'include', e.g. ?include=region
+
+    :param includes: REGION_INCLUDES or EVENT_INCLUDES
+    :param schema_class: schema used if nothing is included
+    :return: (list of loader options, schema class, tuple of included relationship names)
+    """
+    value = request.args.get("include")
+    if not value:
+        return [], schema_class, ()
+    names = tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+    unknown = [name for name in names if name not in includes]
+    if unknown:
+        bad_request(f"Cannot include: {', '.join(unknown)}")
+    options = [includes[name][0] for name in names]
+    return options, includes[names[-1]][1], names
+
+
+def get_fields(schema_class):
+    """Returns the fields requested with the 'fields' query string argument, e.g. /events?fields=year,host
+
+    :param schema_class: Marshmallow schema class, used to check the field names
+    :return: tuple of field names, or None if all fields were requested
+    """
+    value = request.args.get("fields")
+    if not value:
+        return None
+    fields = tuple(sorted({name.strip() for name in value.split(",") if name.strip()}))
+    unknown = [name for name in fields if name not in sparse_schema(schema_class, None).fields]
+    if unknown:
+        bad_request(f"Unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def run_query(query, render):
+    """Runs a query from page_query() or one_query() and returns the response made by its render function.
+
+    The queries and responses are made separately so the async routes in asgi.py can run the same queries with an
+    async session.
+    """
+    return render(db.session.execute(query, bind_arguments=read_bind()))
+
+
+def page_query(model, key_column, schema_class, key_type, query, includes):
+    """Returns the query for one page of a list using keyset pagination on the primary key, and a function that makes
+    the response from the query's result.
+
+    Rows are ordered by the primary key and the page starts after the key given in the 'after' query string
+    argument, so each page is an index seek on the primary key rather than an OFFSET scan. If there are more rows
+    the response has a Link header with the URL of the next page.
+
+    :param model: SQLAlchemy model class
+    :param key_column: primary key column, e.g. Event.id
+    :param schema_class: Marshmallow schema class for the model
+    :param key_type: function to convert the 'after' argument to the type of the key, e.g. int
+    :param query: select statement with any filters
+    :param includes: relationships that can be included, REGION_INCLUDES or EVENT_INCLUDES
+    :return: (select statement, function that takes the query's Result and returns a Flask response with a JSON list)
+    """
+    limit = get_int_arg("limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    options, schema_class, included = get_includes(includes, schema_class)
+    fields = get_fields(schema_class)
+    after = request.args.get("after")
+    if after:
+        try:
+            query = query.filter(key_column > key_type(after))
+        except ValueError:
+            bad_request("'after' is not a valid cursor")
+    # Get one more row than the page size to find out if there is a next page
+    query = query.order_by(key_column).limit(limit + 1)
+
+    if included:
+        # Nested relationships need the ORM objects and the Marshmallow schema
+        if fields:
+            columns = [getattr(model, name) for name in fields if name in model.__table__.columns]
+            options.append(db.load_only(*columns))
+            fields = tuple(sorted(set(fields) | set(included)))
+
+        def render(result):
+            rows = result.scalars().all()
+            page = rows[:limit]
+            with serialization_timer():
+                response = make_response(sparse_schema(schema_class, fields).dump(page))
+            if len(rows) > limit:
+                add_next_link(response, getattr(page[-1], key_column.key), limit)
+            return response
+
+        return query.options(*options), render
+
+    # Select only the columns, without creating ORM objects, and use the compiled serializer
+    columns, key_index, dump = compile_dumper(model, fields)
+
+    def render(result):
+        rows = result.all()
+        page = rows[:limit]
+        with serialization_timer():
+            response = json_response(dump(page))
+        if len(rows) > limit:
+            add_next_link(response, page[-1][key_index], limit)
+        return response
+
+    return query.with_only_columns(*columns), render
+
+
+def add_next_link(response, last_key, limit):
+    """Adds a Link header with the URL of the next page, which starts after last_key, to a list response."""
+    args = request.args.to_dict()
+    args.update(after=last_key, limit=limit)
+    response.headers["Link"] = f'<{url_for(request.endpoint, **args)}>; rel="next"'
+
+
+def one_query(model, query, includes, schema_class, not_found_message):
+    """Returns the query for a single row and a function that makes the response from the query's result: the row as
+    JSON, or a 404 response if there is no row.
+
+    :param model: SQLAlchemy model class
+    :param query: select statement that finds one row
+    :param includes: relationships that can be included, REGION_INCLUDES or EVENT_INCLUDES
+    :param schema_class: Marshmallow schema class for the model
+    :param not_found_message: message returned in the 404 response
+    :return: (select statement, function that takes the query's Result and returns a Flask response)
+    """
+    options, schema_class, included = get_includes(includes, schema_class)
+    if included:
+        def render(result):
+            row = result.unique().scalar_one_or_none()
+            if row is None:
+                abort(make_response({"message": not_found_message}, 404))
+            with serialization_timer():
+                return make_response(schema_class().dump(row))
+
+        return query.options(*options), render
+
+    columns, key_index, dump = compile_dumper(model)
+
+    def render(result):
+        row = result.first()
+        if row is None:
+            abort(make_response({"message": not_found_message}, 404))
+        with serialization_timer():
+            return json_response(dump([row])[0])
+
+    return query.with_only_columns(*columns), render
+
+
+def get_snapshot():
+    """Returns the in-memory snapshot of the regions and events in snapshot mode (see snapshot.py), otherwise None.
+
+    Requests that include related rows are not served from the snapshot.
+    """
+    store = app.extensions.get("snapshot")
+    if store is None or request.args.get("include"):
+        return None
+    return store.get()
+
+
+def snapshot_page(table, records, schema_class, key_type):
+    """Returns a page of records from the snapshot, with the same query string arguments and response as list_page.
+
+    :param table: TableSnapshot of the records
+    :param records: sequence of records from the table, in primary key order
+    :param schema_class: Marshmallow schema class for the model, used to check the field names
+    :param key_type: function to convert the 'after' argument to the type of the key, e.g. int
+    :return: Flask response with a JSON list
+    """
+    limit = get_int_arg("limit", DEFAULT_PAGE_SIZE, 1, MAX_PAGE_SIZE)
+    fields = get_fields(schema_class)
+    after = request.args.get("after")
+    if after:
+        try:
+            after = key_type(after)
+        except ValueError:
+            bad_request("'after' is not a valid cursor")
+        records = records[bisect_right(records, after, key=attrgetter(table.key_name)):]
+    page = records[:limit]
+    with serialization_timer():
+        response = json_response(table.dump(page, fields))
+    if len(records) > limit:
+        add_next_link(response, getattr(page[-1], table.key_name), limit)
+    return response
+
+
+def snapshot_one(table, key, not_found_message):
+    """Returns one record from the snapshot as JSON, or a 404 response if there is no record with the key."""
+    record = table.find(key)
+    if record is None:
+        abort(make_response({"message": not_found_message}, 404))
+    with serialization_timer():
+        return json_response(table.dump([record])[0])
+
+
+def filter_events(query):
+    """Adds the filters in the query string arguments type, NOC, year_from, year_to, from and to to an event query.
+
+    from and to are dates; the events returned are those that overlap the period, i.e. start on or before 'to' and
+    end on or after 'from'. An event with no start date is returned for 'from' if its end date matches, but not for
+    'to', and an event with no end date is not returned for 'from'. filter_event_records() uses the same rule.
+
+    :param query: select statement for Event
+    """
+    if request.args.get("type"):
+        query = query.filter(Event.type == request.args["type"])
+    if request.args.get("NOC"):
+        query = query.filter(Event.NOC == request.args["NOC"])
+    year_from = get_int_arg("year_from")
+    if year_from is not None:
+        query = query.filter(Event.year >= year_from)
+    year_to = get_int_arg("year_to")
+    if year_to is not None:
+        query = query.filter(Event.year <= year_to)
+    date_from = get_date_arg("from")
+    if date_from is not None:
+        query = query.filter(Event.end >= date_from)
+    date_to = get_date_arg("to")
+    if date_to is not None:
+        query = query.filter(Event.start <= date_to)
+        if date_from is not None:
+            # An event that ends on or after 'from' starts at most the longest event's length before it. With 'to'
+            # this gives ix_event_start_end a lower as well as an upper bound, so SQLite seeks the range of start
+            # dates rather than scanning the table in id order. 'start <= to' already leaves out events with no
+            # start date, so the bound does not change the result.
+            longest = db.select(db.func.coalesce(db.func.max(EVENT_DAYS), 0)).scalar_subquery()
+            query = query.filter(Event.start >= db.func.date(db.func.julianday(date_from) - longest))
+    return query
+
+
+def filter_event_records(events):
+    """Returns the event records from the snapshot that match the same filters as filter_events(), in id order.
+
+    The NOC or year index is used to find the records to check, if either is filtered on.
+
+    :param events: TableSnapshot of the events
+    """
+    event_type = request.args.get("type")
+    noc = request.args.get("NOC")
+    year_from = get_int_arg("year_from")
+    year_to = get_int_arg("year_to")
+    date_from = get_date_arg("from")
+    date_to = get_date_arg("to")
+
+    if noc:
+        records = events.lookup("NOC", noc)
+    elif year_from is not None or year_to is not None:
+        years = [year for year in events.indexes["year"]
+                 if (year_from is None or year >= year_from) and (year_to is None or year <= year_to)]
+        records = sorted(chain.from_iterable(events.lookup("year", year) for year in years), key=attrgetter("id"))
+    else:
+        records = events.records
+
+    # Dates are ISO 8601 strings in the snapshot, which compare in date order
+    checks = []
+    if event_type:
+        checks.append(lambda record: record.type == event_type)
+    if year_from is not None:
+        checks.append(lambda record: record.year >= year_from)
+    if year_to is not None:
+        checks.append(lambda record: record.year <= year_to)
+    if date_from is not None:
+        checks.append(lambda record: record.end is not None and record.end >= date_from.isoformat())
+    if date_to is not None:
+        checks.append(lambda record: record.start is not None and record.start <= date_to.isoformat())
+    if checks:
+        records = [record for record in records if all(check(record) for check in checks)]
+    return records
+
+
+# Queries for the region and event GET routes, each returns (select statement, render function) for run_query().
+# They are shared by the Flask routes below and the async routes in asgi.py, and must be called in a request context.
+def regions_query():
+    return page_query(Region, Region.NOC, RegionSchema, str, db.select(Region), REGION_INCLUDES)
+
+
+def region_query(NOC):
+    query = db.select(Region).filter_by(NOC=NOC)
+    return one_query(Region, query, REGION_INCLUDES, RegionSchema, f"Region {NOC} not found")
+
+
+def events_query():
+    return page_query(Event, Event.id, EventSchema, int, filter_events(db.select(Event)), EVENT_INCLUDES)
+
+
+def event_query(event_id):
+    query = db.select(Event).filter_by(id=event_id)
+    return one_query(Event, query, EVENT_INCLUDES, EventSchema, f"Event {event_id} not found")
+
+
+# The query function for each route endpoint, called with the route's URL variables
+ROUTE_QUERIES = {"get_regions": regions_query, "get_region": region_query, "get_events": events_query,
+                 "get_event": event_query}
+
+
+def export_rows(model, schema_class, query):
+    """Returns a streamed response with all the rows of a query as newline-delimited JSON or CSV.
+
+    Rows are fetched from the database EXPORT_BATCH_SIZE at a time (yield_per) and each batch is sent to the client
+    as soon as it is ready, so memory use does not depend on the number of rows. Query string arguments: format
+    (ndjson, the default, or csv) and fields. If the request has 'Accept-Encoding: gzip' the response is compressed
+    as it is sent.
+
+    :param model: SQLAlchemy model class
+    :param schema_class: Marshmallow schema class for the model, used to check the field names
+    :param query: select statement with any filters
+    """
+    export_format = request.args.get("format", "ndjson")
+    if export_format not in ("ndjson", "csv"):
+        bad_request("'format' must be ndjson or csv")
+    fields = get_fields(schema_class)
+    columns, key_index, dump = compile_dumper(model, fields)
+    names = sorted(fields or model.__table__.columns.keys())
+    query = query.with_only_columns(*columns).order_by(columns[key_index])
+    query = query.execution_options(yield_per=EXPORT_BATCH_SIZE)
+    bind_arguments = read_bind()
+    # 'in' would also match 'gzip;q=0', which means the client does not accept gzip
+    use_gzip = request.accept_encodings["gzip"] > 0
+
+    def generate():
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if use_gzip else None
+        first = True
+        for batch in db.session.execute(query, bind_arguments=bind_arguments).partitions():
+            if export_format == "csv":
+                chunk = csv_lines([row[:len(names)] for row in batch], names if first else None)
+            else:
+                chunk = b"".join(json_line(item) for item in dump(batch))
+            first = False
+            if compressor:
+                # Z_SYNC_FLUSH sends the compressed batch now rather than waiting for more data
+                chunk = compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+            yield chunk
+        if export_format == "csv" and first:
+            chunk = csv_lines([], names)
+            yield compressor.compress(chunk) if compressor else chunk
+        if compressor:
+            yield compressor.flush()
+
+    mimetype = "text/csv" if export_format == "csv" else "application/x-ndjson"
+    response = app.response_class(stream_with_context(generate()), mimetype=mimetype)
+    response.headers["Vary"] = "Accept-Encoding"
+    if use_gzip:
+        response.headers["Content-Encoding"] = "gzip"
+    return response
+
+
+def find_or_404(model, not_found_message, **key):
+    """Returns the ORM object with the given primary key, or stops the request with a 404 response.
+
+    :param model: SQLAlchemy model class
+    :param not_found_message: message returned in the 404 response
+    :param key: primary key column and value, e.g. id=1
+    """
+    row = db.session.execute(db.select(model).filter_by(**key)).scalar_one_or_none()
+    if row is None:
+        abort(make_response({"message": not_found_message}, 404))
+    return row
+
+
+def load_or_400(schema, data, **kwargs):
+    """Uses a Marshmallow schema to load JSON to an ORM object, or stops the request with a 400 response.
+
+    :param schema: Marshmallow schema instance
+    :param data: dictionary from the request JSON
+    :param kwargs: passed to schema.load, e.g. instance=existing_event, partial=True
+    """
+    if not isinstance(data, dict):
+        bad_request("The request body must be a JSON object")
+    try:
+        return schema.load(data, **kwargs)
+    except ValidationError as error:
+        abort(make_response({"message": error.messages}, 400))
+
+
+def replacement(model, data, key_name, key_value):
+    """Returns the JSON for a PUT request with every column that is not in the request set to None.
+
+    PUT replaces the whole resource, so a field that is left out is cleared rather than left unchanged. The primary
+    key is taken from the URL.
+    """
+    if not isinstance(data, dict):
+        bad_request("The request body must be a JSON object")
+    values = {name: None for name in model.__table__.columns.keys()}
+    values.update(data)
+    values[key_name] = key_value
+    return values
+
+
+def commit_or_409():
+    """Commits the session, or rolls back and stops the request with a 409 response if a unique key is repeated."""
+    try:
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        abort(make_response({"message": f"Conflicts with an existing row: {error.orig}"}, 409))
+
+
+def batch(model, key_name, schema_class, operation):
+    """Applies a batch of creates, updates or deletes from the JSON array in the request body, see batch.py
+
+    The changes are made in one transaction. Items that repeat a key, of an existing row or of another item, have a
+    409 result. If a unique key is still repeated when the changes are written, e.g. by another request made at the
+    same time, nothing is changed and a 409 response is returned.
+
+    :returns: JSON list with a result for each item in the request, in the same order
+    """
+    items = request.get_json()
+    if not isinstance(items, list):
+        bad_request("The request body must be a JSON array")
+    if len(items) > MAX_BATCH_SIZE:
+        bad_request(f"A batch can have at most {MAX_BATCH_SIZE} items")
+    try:
+        results = apply_batch(model, key_name, schema_class, operation, items)
+        db.session.commit()
+    except IntegrityError as error:
+        db.session.rollback()
+        abort(make_response({"message": f"Conflicts with an existing row: {error.orig}"}, 409))
+    return results
 
 
 @app.route('/')
 def hello():
     return f"Hello!"
+
+
+@app.get("/regions")
+@cached("region", include_tables={"events": "event"}, snapshot=True)
+def get_regions():
+    """Returns a page of NOC regions and their details in JSON.
+
+    Query string arguments: limit, after (the NOC of the last region on the previous page), fields and
+    include=events, e.g. /regions?limit=50&after=GBR&fields=NOC,region
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot_page(snapshot.regions, snapshot.regions.records, RegionSchema, str)
+    return run_query(*regions_query())
+
+
+@app.get("/regions/export")
+def export_regions():
+    """Streams all the regions as newline-delimited JSON, or CSV with format=csv.
+
+    Query string arguments: format and fields, e.g. /regions/export?format=csv&fields=NOC,region
+    """
+    return export_rows(Region, RegionSchema, db.select(Region))
+
+
+@app.post("/regions/batch")
+def add_regions():
+    """Adds the regions in the JSON array in the request body."""
+    return batch(Region, "NOC", RegionSchema, "create")
+
+
+@app.patch("/regions/batch")
+def update_regions():
+    """Updates regions, each item in the JSON array has the NOC and the fields to change."""
+    return batch(Region, "NOC", RegionSchema, "update")
+
+
+@app.delete("/regions/batch")
+def delete_regions():
+    """Deletes the regions with the NOC codes in the JSON array in the request body."""
+    return batch(Region, "NOC", RegionSchema, "delete")
+
+
+@app.get("/regions/<NOC>")
+@cached("region", include_tables={"events": "event"}, snapshot=True)
+def get_region(NOC):
+    """Returns the details of one region in JSON, with its events if requested with include=events.
+
+    :param NOC: The NOC code of the region to return
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot_one(snapshot.regions, NOC, f"Region {NOC} not found")
+    return run_query(*region_query(NOC))
+
+
+@app.post("/regions")
+def add_region():
+    """Adds a new region from the JSON in the request body.
+
+    :returns: JSON message with status code 201
+    """
+    region = load_or_400(region_schema, request.get_json())
+    db.session.add(region)
+    commit_or_409()
+    return {"message": f"Region added with NOC= {region.NOC}"}, 201
+
+
+@app.patch("/regions/<NOC>")
+def update_region(NOC):
+    """Updates the fields of a region that are in the JSON in the request body.
+
+    :param NOC: The NOC code of the region to update
+    :returns: JSON with all the details of the updated region
+    """
+    existing_region = find_or_404(Region, f"Region {NOC} not found", NOC=NOC)
+    region = load_or_400(region_schema, request.get_json(), instance=existing_region, partial=True)
+    commit_or_409()
+    return region_schema.dump(region)
+
+
+@app.put("/regions/<NOC>")
+def replace_region(NOC):
+    """Replaces all the fields of a region with the JSON in the request body.
+
+    :param NOC: The NOC code of the region to replace
+    :returns: JSON with all the details of the region
+    """
+    existing_region = find_or_404(Region, f"Region {NOC} not found", NOC=NOC)
+    data = replacement(Region, request.get_json(), "NOC", NOC)
+    region = load_or_400(region_schema, data, instance=existing_region)
+    commit_or_409()
+    return region_schema.dump(region)
+
+
+@app.delete("/regions/<NOC>")
+def delete_region(NOC):
+    """Deletes a region.
+
+    :param NOC: The NOC code of the region to delete
+    :returns: JSON message with status code 202
+    """
+    region = find_or_404(Region, f"Region {NOC} not found", NOC=NOC)
+    # Event.NOC and Medal.NOC cannot be NULL, so a region that still has events or medals cannot be deleted
+    for model in (Event, Medal):
+        if db.session.execute(db.select(model.NOC).filter_by(NOC=NOC).limit(1)).first():
+            abort(make_response({"message": f"Region {NOC} has {model.__tablename__}s, delete them first"}, 409))
+    db.session.delete(region)
+    commit_or_409()
+    return {"message": f"Region {NOC} deleted"}, 202
+
+
+@app.get("/events")
+@cached("event", include_tables={"region": "region"}, snapshot=True)
+def get_events():
+    """Returns a page of events and their details in JSON.
+
+    Query string arguments: limit, after (the id of the last event on the previous page), fields, include=region
+    and the filters type, NOC, year_from, year_to, from and to, e.g. /events?type=summer&year_from=1990&fields=year,host
+    or /events?from=2012-01-01&to=2012-12-31
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot_page(snapshot.events, filter_event_records(snapshot.events), EventSchema, int)
+    return run_query(*events_query())
+
+
+@app.get("/events/export")
+def export_events():
+    """Streams all the events as newline-delimited JSON, or CSV with format=csv.
+
+    Query string arguments: format, fields and the same filters as /events, e.g. /events/export?format=csv&type=winter
+    """
+    return export_rows(Event, EventSchema, filter_events(db.select(Event)))
+
+
+@app.post("/events/batch")
+def add_events():
+    """Adds the events in the JSON array in the request body."""
+    return batch(Event, "id", EventSchema, "create")
+
+
+@app.patch("/events/batch")
+def update_events():
+    """Updates events, each item in the JSON array has the id and the fields to change."""
+    return batch(Event, "id", EventSchema, "update")
+
+
+@app.delete("/events/batch")
+def delete_events():
+    """Deletes the events with the ids in the JSON array in the request body."""
+    return batch(Event, "id", EventSchema, "delete")
+
+
+@app.get("/events/<int:event_id>")
+@cached("event", include_tables={"region": "region"}, snapshot=True)
+def get_event(event_id):
+    """Returns the details of one event in JSON, with its region if requested with include=region.
+
+    :param event_id: The id of the event to return
+    """
+    snapshot = get_snapshot()
+    if snapshot is not None:
+        return snapshot_one(snapshot.events, event_id, f"Event {event_id} not found")
+    return run_query(*event_query(event_id))
+
+
+@app.post("/events")
+def add_event():
+    """Adds a new event from the JSON in the request body.
+
+    :returns: JSON message with status code 201
+    """
+    event = load_or_400(event_schema, request.get_json())
+    db.session.add(event)
+    commit_or_409()
+    return {"message": f"Event added with id= {event.id}"}, 201
+
+
+@app.patch("/events/<int:event_id>")
+def update_event(event_id):
+    """Updates the fields of an event that are in the JSON in the request body.
+
+    :param event_id: The id of the event to update
+    :returns: JSON with all the details of the updated event
+    """
+    existing_event = find_or_404(Event, f"Event {event_id} not found", id=event_id)
+    event = load_or_400(event_schema, request.get_json(), instance=existing_event, partial=True)
+    commit_or_409()
+    return event_schema.dump(event)
+
+
+@app.put("/events/<int:event_id>")
+def replace_event(event_id):
+    """Replaces all the fields of an event with the JSON in the request body.
+
+    :param event_id: The id of the event to replace
+    :returns: JSON with all the details of the event
+    """
+    existing_event = find_or_404(Event, f"Event {event_id} not found", id=event_id)
+    data = replacement(Event, request.get_json(), "id", event_id)
+    event = load_or_400(event_schema, data, instance=existing_event)
+    commit_or_409()
+    return event_schema.dump(event)
+
+
+@app.delete("/events/<int:event_id>")
+def delete_event(event_id):
+    """Deletes an event.
+
+    :param event_id: The id of the event to delete
+    :returns: JSON message with status code 202
+    """
+    event = find_or_404(Event, f"Event {event_id} not found", id=event_id)
+    db.session.delete(event)
+    commit_or_409()
+    return {"message": f"Event {event_id} deleted"}, 202
+
+
+def stats_rows(query):
+    """Returns the rows of a summary table query as a list of dictionaries."""
+    return [dict(row._mapping) for row in db.session.execute(query, bind_arguments=read_bind())]
+
+
+@app.get("/stats/participants")
+@cached("event")
+def get_participant_stats():
+    """Returns the number of participants, male and female, and the share of female participants for each Games.
+
+    Query string argument: type, e.g. /stats/participants?type=summer
+    """
+    query = db.select(StatsYear.type, StatsYear.year, StatsYear.participants, StatsYear.participants_m,
+                      StatsYear.participants_f, StatsYear.female_share).order_by(StatsYear.type, StatsYear.year)
+    if request.args.get("type"):
+        query = query.filter(StatsYear.type == request.args["type"])
+    return stats_rows(query)
+
+
+@app.get("/stats/events-per-sport")
+@cached("event")
+def get_events_per_sport_stats():
+    """Returns the number of events, sports and events per sport for each Games.
+
+    Query string argument: type, e.g. /stats/events-per-sport?type=winter
+    """
+    query = db.select(StatsYear.type, StatsYear.year, StatsYear.events, StatsYear.sports,
+                      StatsYear.events_per_sport).order_by(StatsYear.type, StatsYear.year)
+    if request.args.get("type"):
+        query = query.filter(StatsYear.type == request.args["type"])
+    return stats_rows(query)
+
+
+@app.get("/stats/hosts")
+@cached("event")
+def get_host_stats():
+    """Returns the number of Games hosted by each NOC and the first and last year they hosted, most Games first."""
+    query = db.select(StatsHost.NOC, StatsHost.games, StatsHost.first_year,
+                      StatsHost.last_year).order_by(StatsHost.games.desc(), StatsHost.NOC)
+    return stats_rows(query)
+
+
+def medal_table(rows):
+    """Adds the rank to each row of a medal table, which must be ordered by gold, silver then bronze medals.
+
+    Teams with the same number of gold, silver and bronze medals have the same rank, and the next rank is skipped.
+    """
+    medals = []
+    for position, row in enumerate(rows, start=1):
+        row = dict(row._mapping)
+        if medals and all(row[name] == medals[-1][name] for name in ("gold", "silver", "bronze")):
+            row["rank"] = medals[-1]["rank"]
+        else:
+            row["rank"] = position
+        medals.append(row)
+    return medals
+
+
+def medals_query():
+    """Returns the query for the medal table of the type in the query string arguments, or of both types."""
+    rank = ("gold", "silver", "bronze")
+    if request.args.get("type"):
+        # Read in order from ix_medal_type_rank
+        return (db.select(Medal.type, Medal.NOC, Medal.team, Medal.games, Medal.gold, Medal.silver, Medal.bronze,
+                          Medal.total)
+                .filter(Medal.type == request.args["type"])
+                .order_by(*(getattr(Medal, name).desc() for name in rank)))
+    totals = [db.func.sum(getattr(Medal, name)).label(name) for name in ("games", *rank, "total")]
+    return (db.select(Medal.NOC, db.func.min(Medal.team).label("team"), *totals)
+            .group_by(Medal.NOC)
+            .order_by(*(db.desc(name) for name in rank), Medal.NOC))
+
+
+@app.get("/medals")
+@cached("medal")
+def get_medals():
+    """Returns the medal table for the Summer or the Winter Games, or for both if type is not given.
+
+    Each team has its total medals over all the Games of that type, with the number of Games it took part in.
+
+    Query string argument: type, e.g. /medals?type=summer
+    """
+    return medal_table(db.session.execute(medals_query(), bind_arguments=read_bind()))
+
+
+@app.get("/regions/<NOC>/medals")
+@cached("medal")
+def get_region_medals(NOC):
+    """Returns the medals won by a region at the Summer and at the Winter Games.
+
+    :param NOC: The NOC code of the region
+    """
+    query = (db.select(Medal.type, Medal.NOC, Medal.team, Medal.games, Medal.gold, Medal.silver, Medal.bronze,
+                       Medal.total)
+             .filter(Medal.NOC == NOC)
+             .order_by(Medal.type))
+    return stats_rows(query)
+
+
+@app.get("/metrics")
+def get_metrics():
+    """Returns the request, query and timing totals for each route in the Prometheus text format.
+
+    Only available when METRICS is True in the config, see metrics.py.
+    """
+    registry = app.extensions.get("metrics")
+    if registry is None:
+        abort(404)
+    return app.response_class(registry.prometheus_text(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/search")
+@cached("event", "region")
+def search_events_and_regions():
+    """Returns the events and regions that contain all the words in q, best match first.
+
+    Events are searched by host, country and highlights, regions by name and notes. Each result has a snippet of the
+    matching text with the matching words in <mark> tags.
+
+    Query string arguments: q and limit (default 20, at most 100), e.g. /search?q=wheelchair+rugby
+    """
+    search_text = request.args.get("q", "")
+    if not search_text.strip():
+        bad_request("'q' must have the words to search for")
+    return search(search_text, get_int_arg("limit", 20, 1, 100))
@@ -0,0 +1,120 @@
+from datetime import date, datetime
+
+from marshmallow import ValidationError, fields
+
+from paralympics.models import Event, Region
+from paralympics import db, ma
+
+# Date formats accepted for event start and end dates, e.g. '2012-08-29', '29/08/2012' (the CSV file) or '29-Aug-12'.
+# The formats with a two-digit year are only accepted when the year of the event is known, see parse_date.
+DATE_FORMATS = ("%Y-%m-%d", "%d/%m/%Y", "%d-%b-%Y")
+TWO_DIGIT_YEAR_FORMATS = ("%d-%b-%y",)
+
+
+def parse_date(value, year=None):
+    """Converts a date string in one of the DATE_FORMATS to a date.
+
+    The two formats in the data, YYYY-MM-DD and dd/mm/yyyy, are converted without strptime as this is used for every
+    row when the CSV file is loaded.
+
+    A date with a two-digit year, e.g. '18-Sep-60', is only accepted if the year of the event is given and the date
+    is within a year of it; the century is taken from the event's year (strptime would make '60' 2060).
+
+    :param value: date string
+    :param year: year of the event the date is for, or None if it is not known
+    :return: datetime.date
+    :raises ValueError: if the value is not in any of the formats
+    """
+    value = value.strip()
+    try:
+        if len(value) == 10 and value[2] == "/" and value[5] == "/":
+            return date(int(value[6:10]), int(value[3:5]), int(value[0:2]))
+        return date.fromisoformat(value)
+    except ValueError:
+        pass
+    for date_format in DATE_FORMATS[2:]:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            pass
+    if year is not None:
+        for date_format in TWO_DIGIT_YEAR_FORMATS:
+            try:
+                parsed = datetime.strptime(value, date_format).date()
+            except ValueError:
+                continue
+            # The Games start and end in the year of the event, or the year either side of it
+            for full_year in (year, year - 1, year + 1):
+                if full_year % 100 == parsed.year % 100:
+                    return parsed.replace(year=full_year)
+    raise ValueError(f"'{value}' is not a date, use YYYY-MM-DD")
+
+
+def event_year(data, instance):
+    """Returns the year of the event being loaded, from the request JSON or the event being updated, or None."""
+    year = data.get("year") if isinstance(data, dict) else None
+    if year is None and instance is not None:
+        year = instance.year
+    try:
+        return int(year)
+    except (TypeError, ValueError):
+        return None
+
+
+class FlexibleDate(fields.Date):
+    """Date field that loads any of the DATE_FORMATS and dumps YYYY-MM-DD.
+
+    Dates with a two-digit year take the century from the event's year.
+    """
+
+    def _deserialize(self, value, attr, data, **kwargs):
+        if isinstance(value, date):
+            return value
+        try:
+            return parse_date(value, event_year(data, getattr(self.parent, "instance", None)))
+        except (ValueError, AttributeError):
+            raise ValidationError("Not a valid date, use YYYY-MM-DD.")
+
+
+# Flask-Marshmallow Schemas
+# See https://marshmallow-sqlalchemy.readthedocs.io/en/latest/#generate-marshmallow-schemas
+
+class RegionSchema(ma.SQLAlchemySchema):
+    """Marshmallow schema defining the attributes for creating a new region."""
+
+    class Meta:
+        model = Region
+        load_instance = True
+        sqla_session = db.session
+        include_relationships = True
+
+    NOC = ma.auto_field()
+    region = ma.auto_field()
+    notes = ma.auto_field()
+
+
+class EventSchema(ma.SQLAlchemyAutoSchema):
+    """Marshmallow schema for the attributes of an event class. Inherits all the attributes from the Event class.
+
+    The region relationship is not included as a field as NOC already gives the region code, and dumping the
+    relationship would query the region table for each event.
+    """
+
+    class Meta:
+        model = Event
+        include_fk = True
+        load_instance = True
+        sqla_session = db.session
+
+    start = FlexibleDate(allow_none=True)
+    end = FlexibleDate(allow_none=True)
+
+
+class RegionWithEventsSchema(RegionSchema):
+    """Region schema that includes the region's events as nested objects, used for /regions?include=events"""
+    events = ma.Nested(EventSchema, many=True)
+
+
+class EventWithRegionSchema(EventSchema):
+    """Event schema that includes the event's region as a nested object, used for /events?include=region"""
+    region = ma.Nested(RegionSchema)
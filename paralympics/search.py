@@ -0,0 +1,94 @@
+# Full-text search of events and regions using SQLite FTS5, see https://www.sqlite.org/fts5.html
+#
+# event_search has the host, country and highlights of each event, with the event id as the rowid. region_search has
+# the name and notes of each region. Both are kept up to date by triggers on the event and region tables, so they are
+# updated by every change to the data, including the bulk loaders and other processes.
+from sqlalchemy import text
+
+from paralympics import db, read_bind
+
+SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS event_search USING fts5(host, country, highlights)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS region_search USING fts5(NOC UNINDEXED, region, notes)",
+    """CREATE TRIGGER IF NOT EXISTS event_search_insert AFTER INSERT ON event BEGIN
+        INSERT INTO event_search(rowid, host, country, highlights)
+        VALUES (new.id, new.host, new.country, new.highlights);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_search_delete AFTER DELETE ON event BEGIN
+        DELETE FROM event_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS event_search_update AFTER UPDATE OF id, host, country, highlights ON event BEGIN
+        DELETE FROM event_search WHERE rowid = old.id;
+        INSERT INTO event_search(rowid, host, country, highlights)
+        VALUES (new.id, new.host, new.country, new.highlights);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS region_search_insert AFTER INSERT ON region BEGIN
+        INSERT INTO region_search(NOC, region, notes) VALUES (new.NOC, new.region, new.notes);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS region_search_delete AFTER DELETE ON region BEGIN
+        DELETE FROM region_search WHERE NOC = old.NOC;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS region_search_update AFTER UPDATE OF NOC, region, notes ON region BEGIN
+        DELETE FROM region_search WHERE NOC = old.NOC;
+        INSERT INTO region_search(NOC, region, notes) VALUES (new.NOC, new.region, new.notes);
+    END""",
+]
+
+# Events and regions matching the search, best match first. bm25() is lower for better matches.
+# snippet() column -1 picks the column with the best match and marks the matching words.
+SEARCH_SQL = text("""
+    SELECT 'event' AS type, '/events/' || event.id AS url, event.host || ' ' || event.year AS title,
+           snippet(event_search, -1, '<mark>', '</mark>', '...', 12) AS snippet, bm25(event_search) AS rank
+    FROM event_search JOIN event ON event.id = event_search.rowid
+    WHERE event_search MATCH :query
+    UNION ALL
+    SELECT 'region', '/regions/' || region_search.NOC, region_search.region,
+           snippet(region_search, -1, '<mark>', '</mark>', '...', 12), bm25(region_search)
+    FROM region_search
+    WHERE region_search MATCH :query
+    ORDER BY rank
+    LIMIT :limit
+""")
+
+
+def create_search_index(connection):
+    """Creates the full-text search tables and triggers if they do not exist, and fills them from the data.
+
+    :param connection: SQLAlchemy connection, e.g. db.session.connection()
+    """
+    for statement in SEARCH_DDL:
+        connection.exec_driver_sql(statement)
+    connection.exec_driver_sql("DELETE FROM event_search")
+    connection.exec_driver_sql("INSERT INTO event_search(rowid, host, country, highlights) "
+                               "SELECT id, host, country, highlights FROM event")
+    connection.exec_driver_sql("DELETE FROM region_search")
+    connection.exec_driver_sql("INSERT INTO region_search(NOC, region, notes) SELECT NOC, region, notes FROM region")
+
+
+def match_query(search_text):
+    """Converts the text a user searched for to an FTS5 query that matches rows containing all the words.
+
+    Each word is quoted so characters that have a meaning in FTS5 queries, such as '-' or '*', are searched for
+    rather than causing a syntax error.
+
+    :param search_text: e.g. 'wheelchair rugby'
+    :return: e.g. '"wheelchair" "rugby"', or None if there are no words
+    """
+    words = search_text.split()
+    if not words:
+        return None
+    return " ".join('"' + word.replace('"', '""') + '"' for word in words)
+
+
+def search(search_text, limit):
+    """Returns the events and regions that match the search text, best match first.
+
+    :param search_text: words to search for
+    :param limit: the most results to return
+    :return: list of dictionaries with type, url, title and snippet
+    """
+    query = match_query(search_text)
+    if query is None:
+        return []
+    rows = db.session.execute(SEARCH_SQL, {"query": query, "limit": limit}, bind_arguments=read_bind())
+    return [{"type": row.type, "url": row.url, "title": row.title, "snippet": row.snippet} for row in rows]
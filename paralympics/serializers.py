@@ -0,0 +1,112 @@
+# Fast serialization of Event and Region rows for the read-only routes
+#
+# The Marshmallow schemas in schemas.py look up and call a field object for each attribute of each row. For the
+# columns of Event and Region that is only needed to convert dates to strings, so this module works out once, from
+# the mapped columns, which columns to select and how to convert each row, and then builds the dictionaries from
+# SQLAlchemy Core rows without creating ORM objects. The output is the same as EventSchema/RegionSchema.dump().
+import csv
+import io
+import json
+from datetime import date, datetime
+from functools import lru_cache
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+
+# orjson is optional, if it is not installed the JSON is created by Flask's json provider
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@lru_cache(maxsize=128)
+def compile_dumper(model, fields=None):
+    """Returns the columns to select for a model and a function that converts the selected rows to dictionaries.
+
+    The dictionaries have the same keys and values as the model's Marshmallow schema, or only the given fields.
+    The primary key is always selected, after the fields, so it can be used as the cursor for the next page.
+    Results are cached, so each model and set of fields is only compiled once.
+
+    :param model: SQLAlchemy model class, e.g. Event
+    :param fields: tuple of column names, or None for all the columns
+    :return: (list of columns to select, index of the primary key in each row, dump function)
+    """
+    table = model.__table__
+    names = tuple(sorted(fields if fields else table.columns.keys()))
+    columns = [table.columns[name] for name in names]
+    key_name = table.primary_key.columns.values()[0].key
+    if key_name in names:
+        key_index = names.index(key_name)
+    else:
+        key_index = len(columns)
+        columns.append(table.columns[key_name])
+
+    # Marshmallow dumps dates as ISO 8601 strings, all other column types are dumped as they are
+    date_indexes = [index for index, column in enumerate(columns[:len(names)])
+                    if column.type.python_type in (date, datetime)]
+
+    if date_indexes:
+        def dump(rows):
+            results = []
+            for row in rows:
+                values = list(row)
+                for index in date_indexes:
+                    if values[index] is not None:
+                        values[index] = values[index].isoformat()
+                results.append(dict(zip(names, values)))
+            return results
+    else:
+        def dump(rows):
+            # zip stops at the end of names, so a primary key selected only for the cursor is not included
+            return [dict(zip(names, row)) for row in rows]
+
+    return columns, key_index, dump
+
+
+def json_response(data):
+    """Returns a JSON response for the data, with the same bytes as returning the data from a route.
+
+    If orjson is installed it is used to encode the data, otherwise, or if the output would differ from Flask's
+    (non-ASCII text is escaped by Flask, debug mode indents the JSON), Flask's json provider is used.
+
+    :param data: list or dictionary of JSON types
+    """
+    provider = current_app.json
+    compact = provider.compact if provider.compact is not None else not current_app.debug
+    if orjson is not None and compact and type(provider) is DefaultJSONProvider \
+            and provider.sort_keys and provider.ensure_ascii:
+        try:
+            body = orjson.dumps(data, option=orjson.OPT_SORT_KEYS)
+        except TypeError:
+            body = None
+        if body is not None and body.isascii():
+            return current_app.response_class(body + b"\n", mimetype=provider.mimetype)
+    return provider.response(data)
+
+
+def json_line(data):
+    """Returns one line of newline-delimited JSON (NDJSON) as bytes, with the keys sorted as in the JSON responses.
+
+    :param data: dictionary of JSON types
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_SORT_KEYS | orjson.OPT_APPEND_NEWLINE)
+        except TypeError:
+            pass
+    return (json.dumps(data, sort_keys=True, separators=(",", ":")) + "\n").encode()
+
+
+def csv_lines(rows, header=None):
+    """Returns CSV text as bytes for a batch of rows, with the header row first if it is given.
+
+    :param rows: list of tuples or lists of values
+    :param header: list of column names, or None
+    """
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if header:
+        writer.writerow(header)
+    writer.writerows(rows)
+    return buffer.getvalue().encode()
@@ -0,0 +1,162 @@
+# Read-only in-memory snapshot of the region and event tables
+#
+# The regions and events rarely change, so in snapshot mode (SNAPSHOT = True in config.py) the GET routes read them
+# from a copy held in memory instead of querying SQLite. Each row is a record with __slots__ holding the values as
+# they are returned in the JSON (dates are ISO 8601 strings), and each table has dictionaries that find the records
+# by primary key and by the indexed columns. A snapshot is never changed once it has been built: when the tables
+# change, a new snapshot is built and replaces the old one in a single assignment, so a request always sees one
+# consistent snapshot.
+#
+# The snapshot is built by the first request that needs it. The TableVersion rows (see cache.py) are read at most once
+# every SNAPSHOT_CHECK_INTERVAL seconds to find out whether another process has changed the tables; changes committed
+# by this process are seen by the next request.
+import threading
+import time
+from functools import lru_cache
+from operator import attrgetter
+
+from paralympics import db, read_bind
+from paralympics.cache import read_table_versions
+from paralympics.models import Event, Region
+from paralympics.serializers import compile_dumper
+
+# Tables in the snapshot, with the columns that have an index as well as the primary key
+SNAPSHOT_INDEXES = {Region: (), Event: ("NOC", "year")}
+
+
+@lru_cache(maxsize=None)
+def record_type(model):
+    """Returns a class for read-only records of a model, with one slot for each column.
+
+    :param model: SQLAlchemy model class, e.g. Event
+    """
+    names = tuple(sorted(model.__table__.columns.keys()))
+
+    def __init__(self, values):
+        for name, value in zip(names, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read-only")
+
+    return type(f"{model.__name__}Record", (), {"__slots__": names, "__init__": __init__,
+                                                  "__setattr__": __setattr__})
+
+
+class TableSnapshot:
+    """The rows of one table as read-only records, in primary key order, with dictionary indexes.
+
+    :param model: SQLAlchemy model class
+    :param rows: dictionaries of the rows as dumped by the model's schema, in primary key order
+    :param index_names: columns to index, as well as the primary key
+    """
+    __slots__ = ("names", "key_name", "records", "by_key", "indexes")
+
+    def __init__(self, model, rows, index_names=()):
+        record_class = record_type(model)
+        self.names = record_class.__slots__
+        self.key_name = model.__table__.primary_key.columns.values()[0].key
+        self.records = tuple(record_class([row[name] for name in self.names]) for row in rows)
+        self.by_key = {getattr(record, self.key_name): record for record in self.records}
+        self.indexes = {}
+        for name in index_names:
+            index = {}
+            for record in self.records:
+                index.setdefault(getattr(record, name), []).append(record)
+            self.indexes[name] = {value: tuple(records) for value, records in index.items()}
+
+    def find(self, key):
+        """Returns the record with the primary key, or None."""
+        return self.by_key.get(key)
+
+    def lookup(self, name, value):
+        """Returns the records, in primary key order, with the value in an indexed column."""
+        return self.indexes[name].get(value, ())
+
+    def dump(self, records, fields=None):
+        """Returns the records as dictionaries, the same as the model's schema would dump them.
+
+        :param records: sequence of records from this table
+        :param fields: tuple of column names, or None for all the columns
+        """
+        names = fields or self.names
+        get_values = attrgetter(*names)
+        if len(names) == 1:
+            return [{names[0]: get_values(record)} for record in records]
+        return [dict(zip(names, get_values(record))) for record in records]
+
+
+class Snapshot:
+    """The regions and events at the table versions the snapshot was built from."""
+    __slots__ = ("versions", "regions", "events")
+
+    def __init__(self, versions, regions, events):
+        self.versions = versions
+        self.regions = regions
+        self.events = events
+
+
+def build_table(model):
+    """Reads all the rows of a table, in primary key order, into a TableSnapshot."""
+    columns, key_index, dump = compile_dumper(model)
+    query = db.select(*columns).order_by(columns[key_index])
+    rows = dump(db.session.execute(query, bind_arguments=read_bind()))
+    return TableSnapshot(model, rows, SNAPSHOT_INDEXES[model])
+
+
+def build_snapshot(versions, previous=None):
+    """Returns a snapshot of the tables at the given versions.
+
+    Tables with the same version as in the previous snapshot are not read again. The versions are read before the
+    rows, so if a table changes in between the snapshot is newer than its versions and is rebuilt by the next check.
+
+    :param versions: dictionary of the version of each table, from read_table_versions()
+    :param previous: the snapshot being replaced, or None
+    """
+    tables = {}
+    for name, model in (("regions", Region), ("events", Event)):
+        table_name = model.__tablename__
+        if previous is not None and previous.versions.get(table_name, 0) == versions.get(table_name, 0):
+            tables[name] = getattr(previous, name)
+        else:
+            tables[name] = build_table(model)
+    return Snapshot(versions, **tables)
+
+
+class SnapshotStore:
+    """Holds the current snapshot and replaces it when the tables change.
+
+    :param check_interval: most seconds between checks of the table versions
+    """
+
+    def __init__(self, check_interval=1.0):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked = float("-inf")
+        self._lock = threading.Lock()
+
+    def get(self):
+        """Returns the current snapshot, checking the table versions first if check_interval has passed.
+
+        Only one thread checks or rebuilds the snapshot at a time; the others use the current snapshot meanwhile.
+        """
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked < self.check_interval:
+            return snapshot
+        if not self._lock.acquire(blocking=snapshot is None):
+            return snapshot
+        try:
+            snapshot = self._snapshot
+            if snapshot is None or time.monotonic() - self._checked >= self.check_interval:
+                versions = read_table_versions()
+                if snapshot is None or snapshot.versions != versions:
+                    snapshot = build_snapshot(versions, snapshot)
+                    self._snapshot = snapshot
+                self._checked = time.monotonic()
+            return snapshot
+        finally:
+            self._lock.release()
+
+    def expire(self):
+        """Makes the next get() check the table versions, e.g. after this process commits a change."""
+        self._checked = float("-inf")
@@ -0,0 +1,79 @@
+# Summary tables for the /stats routes
+#
+# The statistics are calculated in SQL from the event table and saved in the stats_year and stats_host tables, so the
+# /stats routes read a few pre-calculated rows instead of aggregating every event for each request.
+# When events are changed with the ORM, only the summary rows for the Games and NOCs that changed are recalculated, in
+# the same transaction (after_flush below). The bulk loaders in database_utils recalculate all the rows.
+from itertools import product
+
+from sqlalchemy import case, cast, delete, event, func, insert, inspect, select, tuple_, Float
+from flask_sqlalchemy.session import Session
+
+from paralympics.models import Event, StatsHost, StatsYear
+
+event_table = Event.__table__
+stats_year = StatsYear.__table__
+stats_host = StatsHost.__table__
+
+
+def ratio(numerator, denominator):
+    """SQL expression for numerator / denominator rounded to 4 decimal places, NULL if the denominator is 0 or NULL."""
+    return case((denominator > 0, func.round(cast(numerator, Float) / denominator, 4)), else_=None)
+
+
+def refresh_stats(connection, year_keys=None, nocs=None):
+    """Recalculates the summary tables from the event table.
+
+    If no keys are given all the rows are recalculated, otherwise only the rows for the given Games and NOCs.
+
+    :param connection: SQLAlchemy connection, e.g. db.session.connection()
+    :param year_keys: set of (type, year) tuples of the Games that changed, or None for all
+    :param nocs: set of NOC codes that changed, or None for all
+    """
+    if year_keys is None or year_keys:
+        year_query = select(
+            event_table.c.type, event_table.c.year, event_table.c.participants, event_table.c.participants_m,
+            event_table.c.participants_f, ratio(event_table.c.participants_f, event_table.c.participants),
+            event_table.c.events, event_table.c.sports, ratio(event_table.c.events, event_table.c.sports),
+        )
+        remove_years = delete(stats_year)
+        if year_keys is not None:
+            year_query = year_query.where(tuple_(event_table.c.type, event_table.c.year).in_(year_keys))
+            remove_years = remove_years.where(tuple_(stats_year.c.type, stats_year.c.year).in_(year_keys))
+        connection.execute(remove_years)
+        connection.execute(insert(stats_year).from_select(
+            ["type", "year", "participants", "participants_m", "participants_f", "female_share", "events", "sports",
+             "events_per_sport"], year_query))
+
+    if nocs is None or nocs:
+        host_query = select(
+            event_table.c.NOC, func.count(), func.min(event_table.c.year), func.max(event_table.c.year)
+        ).where(event_table.c.NOC.is_not(None)).group_by(event_table.c.NOC)
+        remove_hosts = delete(stats_host)
+        if nocs is not None:
+            host_query = host_query.where(event_table.c.NOC.in_(nocs))
+            remove_hosts = remove_hosts.where(stats_host.c.NOC.in_(nocs))
+        connection.execute(remove_hosts)
+        connection.execute(insert(stats_host).from_select(["NOC", "games", "first_year", "last_year"], host_query))
+
+
+@event.listens_for(Session, "after_flush")
+def refresh_changed_stats(session, flush_context):
+    """Recalculates the summary rows for the events added, changed or deleted in the flush.
+
+    Both the new and the previous values of type, year and NOC are used, so a summary row is also recalculated when an
+    event is moved to a different Games or NOC.
+    """
+    year_keys = set()
+    nocs = set()
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        if not isinstance(instance, Event):
+            continue
+        attrs = inspect(instance).attrs
+        types = {instance.type, *attrs.type.history.deleted}
+        years = {instance.year, *attrs.year.history.deleted}
+        year_keys.update(product(types, years))
+        nocs.update({instance.NOC, *attrs.NOC.history.deleted})
+    nocs.discard(None)
+    if year_keys or nocs:
+        refresh_stats(session.connection(), year_keys, nocs)
@@ -0,0 +1,28 @@
+import pytest
+
+from paralympics import create_app, db
+from paralympics.database_utils import add_data, init_db
+
+
+@pytest.fixture(scope="session")
+def app(tmp_path_factory):
+    """App with the data in a temporary database file.
+
+    The routes are registered on the first app created in a process, so the tests share one app.
+    """
+    db_file = tmp_path_factory.mktemp("db").joinpath("paralympics.sqlite")
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{db_file}",
+        "SQLALCHEMY_ECHO": False,
+        "RESPONSE_CACHE": False,
+    })
+    with app.app_context():
+        init_db(db)
+        add_data(db)
+    yield app
+
+
+@pytest.fixture()
+def client(app):
+    return app.test_client()
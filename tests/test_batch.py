@@ -0,0 +1,57 @@
+def test_batch_create_reports_repeated_unique_keys(client):
+    """
+    GIVEN new events that repeat the (type, year) of an existing event, or of another item in the batch
+    WHEN they are posted to /events/batch
+    THEN each of them has a 409 result, and the other items are still added
+    """
+    new_event = {"type": "test", "year": 1900, "country": "UK", "host": "London", "NOC": "GBR"}
+    existing = {**new_event, "type": "summer", "year": 2012}
+    response = client.post("/events/batch", json=[existing, new_event, new_event])
+    try:
+        assert response.status_code == 200
+        statuses = [result["status"] for result in response.json]
+        assert statuses == [409, 201, 409]
+        assert "already exists" in response.json[0]["errors"]["year"][0]
+        assert "repeated in the batch" in response.json[2]["errors"]["year"][0]
+    finally:
+        client.delete("/events/batch", json=[result["id"] for result in response.json if result["status"] == 201])
+
+
+def test_batch_update_reports_repeated_keys(client):
+    """
+    GIVEN updates that would give an event the (type, year) of another event, or that repeat an id in the batch
+    WHEN they are sent to /events/batch
+    THEN each of them has a 409 result
+    """
+    events = client.get("/events?type=summer&limit=2&fields=id,year,host").json
+    unchanged = {"id": events[1]["id"], "host": events[1]["host"]}
+    response = client.patch("/events/batch", json=[
+        {"id": events[0]["id"], "year": events[1]["year"]},
+        unchanged,
+        unchanged,
+    ])
+    assert [result["status"] for result in response.json] == [409, 200, 409]
+
+
+def test_batch_delete_region_with_events(client):
+    """
+    GIVEN a region that has events
+    WHEN it is deleted with /regions/batch
+    THEN its result is a 409 and the region is not deleted
+    """
+    response = client.delete("/regions/batch", json=["GBR"])
+    assert response.json[0]["status"] == 409
+    assert client.get("/regions/GBR").status_code == 200
+
+
+def test_batch_delete_reports_repeated_keys(client):
+    """
+    GIVEN a batch delete with the same event id twice
+    WHEN it is sent to /events/batch
+    THEN the event is deleted once and the repeated id has a 409 result
+    """
+    new_event = {"type": "test", "year": 1901, "country": "UK", "host": "London", "NOC": "GBR"}
+    event_id = client.post("/events/batch", json=[new_event]).json[0]["id"]
+    response = client.delete("/events/batch", json=[event_id, event_id])
+    assert [result["status"] for result in response.json] == [202, 409]
+    assert client.get(f"/events/{event_id}").status_code == 404
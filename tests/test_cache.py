@@ -0,0 +1,46 @@
+import sqlite3
+
+import pytest
+
+from paralympics import db
+from paralympics.cache import ResponseCache
+from paralympics.snapshot import SnapshotStore
+
+
+@pytest.fixture()
+def snapshot_mode(app):
+    """Turns on the response cache and snapshot mode, with a snapshot that is not checked again during the test."""
+    app.extensions["response_cache"] = ResponseCache()
+    app.extensions["snapshot"] = SnapshotStore(check_interval=3600)
+    yield
+    del app.extensions["response_cache"]
+    del app.extensions["snapshot"]
+
+
+def write_from_another_process(app, sql):
+    """Changes the database with its own connection, as another worker process would, and bumps the event version."""
+    with app.app_context():
+        path = db.engine.url.database
+    connection = sqlite3.connect(path)
+    with connection:
+        connection.execute(sql)
+        connection.execute("UPDATE table_version SET version = version + 1 WHERE table_name = 'event'")
+    connection.close()
+
+
+def test_routes_outside_snapshot_are_not_stale(app, client, snapshot_mode):
+    """
+    GIVEN snapshot mode and a cached /stats/hosts response
+    WHEN another process changes the hosts and the event table version
+    THEN /stats/hosts returns the new data although the snapshot has not been checked again
+    """
+    client.get("/events")
+    before = client.get("/stats/hosts")
+    write_from_another_process(app, "UPDATE stats_host SET games = games + 100 WHERE NOC = 'GBR'")
+    try:
+        after = client.get("/stats/hosts", headers={"If-None-Match": before.headers["ETag"]})
+        assert after.status_code == 200
+        assert after.headers["ETag"] != before.headers["ETag"]
+        assert after.json[0]["NOC"] == "GBR"
+    finally:
+        write_from_another_process(app, "UPDATE stats_host SET games = games - 100 WHERE NOC = 'GBR'")
@@ -0,0 +1,26 @@
+import gzip
+
+import pytest
+
+
+@pytest.mark.parametrize("accept_encoding, compressed", [
+    ("gzip", True),
+    ("gzip;q=0.5, identity", True),
+    ("gzip;q=0", False),
+    ("identity", False),
+])
+def test_export_gzip(client, accept_encoding, compressed):
+    """
+    GIVEN an Accept-Encoding header
+    WHEN the events are exported
+    THEN the response is gzip compressed only if the client accepts gzip with a quality above 0
+    """
+    response = client.get("/events/export?format=csv", headers={"Accept-Encoding": accept_encoding})
+    assert response.status_code == 200
+    body = response.get_data()
+    if compressed:
+        assert response.headers["Content-Encoding"] == "gzip"
+        body = gzip.decompress(body)
+    else:
+        assert "Content-Encoding" not in response.headers
+    assert body.startswith(b"NOC,")
@@ -0,0 +1,42 @@
+import pytest
+from sqlalchemy import event
+
+from paralympics import db
+
+
+@pytest.fixture()
+def count_queries(app, client):
+    """Returns a function that makes a GET request and returns the number of SQL statements it ran."""
+    # The first request checks the schema version, so make one before counting
+    client.get("/")
+    with app.app_context():
+        engine = db.engine
+    statements = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    def count(url):
+        statements.clear()
+        response = client.get(url)
+        assert response.status_code == 200
+        return len(statements)
+
+    event.listen(engine, "before_cursor_execute", record)
+    yield count
+    event.remove(engine, "before_cursor_execute", record)
+
+
+@pytest.mark.parametrize("url, expected", [
+    ("/events?include=region&limit=5", 1),
+    ("/events?include=region&limit=30", 1),
+    ("/regions?include=events&limit=5", 2),
+    ("/regions?include=events&limit=100", 2),
+])
+def test_include_query_count(count_queries, url, expected):
+    """
+    GIVEN a list request that includes the related rows
+    WHEN the page is returned
+    THEN the number of SQL statements does not depend on the page size
+    """
+    assert count_queries(url) == expected
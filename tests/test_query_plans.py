@@ -0,0 +1,32 @@
+import pytest
+
+from paralympics import db
+from paralympics.database_utils import (INDEX_CHECK_REQUESTS, assert_uses_index, explain_query_plan,
+                                        index_check_queries)
+
+
+@pytest.mark.parametrize("url, index_name", INDEX_CHECK_REQUESTS)
+def test_filter_query_uses_index(app, url, index_name):
+    """
+    GIVEN the query the endpoint runs for a filter request
+    WHEN SQLite plans the query
+    THEN it uses the index for the filter
+    """
+    with app.app_context():
+        statements = {url: statement for url, statement, _ in index_check_queries(app)}
+        assert_uses_index(db, statements[url], index_name)
+
+
+@pytest.mark.parametrize("url", ["/events?type=summer", "/events?NOC=GBR", "/events?type=summer&after=10"])
+def test_filtered_page_is_not_sorted(app, url):
+    """
+    GIVEN a keyset page of events filtered on type or NOC
+    WHEN SQLite plans the query
+    THEN the rows are read in id order from the index rather than sorted
+    """
+    # The routes module can only be imported once the app has been created
+    from paralympics.paralympics import events_query
+
+    with app.app_context(), app.test_request_context(url):
+        plan = explain_query_plan(db, events_query()[0])
+    assert not any("TEMP B-TREE" in step for step in plan), plan
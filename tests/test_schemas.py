@@ -0,0 +1,60 @@
+from datetime import date
+
+import pytest
+
+from paralympics.schemas import parse_date
+
+
+@pytest.mark.parametrize("value, expected", [
+    ("2012-08-29", date(2012, 8, 29)),
+    ("29/08/2012", date(2012, 8, 29)),
+    ("29-Aug-2012", date(2012, 8, 29)),
+    (" 2012-08-29 ", date(2012, 8, 29)),
+])
+def test_parse_date_formats(value, expected):
+    assert parse_date(value) == expected
+
+
+@pytest.mark.parametrize("value, year, expected", [
+    # The century comes from the event's year, not strptime's 1969 pivot
+    ("18-Sep-60", 1960, date(1960, 9, 18)),
+    ("18-Sep-60", 2060, date(2060, 9, 18)),
+    ("29-Aug-12", 2012, date(2012, 8, 29)),
+    # A date in the year either side of the event's year
+    ("02-Jan-61", 1960, date(1961, 1, 2)),
+    ("30-Dec-99", 2000, date(1999, 12, 30)),
+    ("01-Jan-00", 1999, date(2000, 1, 1)),
+])
+def test_parse_date_two_digit_year(value, year, expected):
+    assert parse_date(value, year) == expected
+
+
+@pytest.mark.parametrize("value, year", [
+    # Two-digit years need the event's year
+    ("18-Sep-60", None),
+    # and must be within a year of it
+    ("18-Sep-60", 2022),
+    ("18-Sep-62", 1960),
+    ("not a date", 2012),
+    ("31/02/2012", None),
+])
+def test_parse_date_rejects(value, year):
+    with pytest.raises(ValueError):
+        parse_date(value, year)
+
+
+def test_post_event_two_digit_year(client):
+    """
+    GIVEN a new event with start and end dates that have two-digit years
+    WHEN it is posted to /events
+    THEN the dates are saved in the century of the event's year
+    """
+    response = client.post("/events", json={"type": "test", "year": 1960, "country": "Italy", "host": "Rome",
+                                            "NOC": "ITA", "start": "18-Sep-60", "end": "25-Sep-60"})
+    assert response.status_code == 201
+    event_id = int(response.json["message"].split("=")[1])
+    try:
+        event = client.get(f"/events/{event_id}").json
+        assert (event["start"], event["end"]) == ("1960-09-18", "1960-09-25")
+    finally:
+        client.delete(f"/events/{event_id}")
@@ -0,0 +1,95 @@
+import pytest
+
+from paralympics.snapshot import SnapshotStore
+
+
+@pytest.fixture()
+def compare_snapshot(app, client):
+    """Returns a function that makes a GET request from the database and from the snapshot and checks that the
+    status, body and Link header are the same."""
+
+    def compare(url):
+        from_database = client.get(url)
+        app.extensions["snapshot"] = SnapshotStore(check_interval=0)
+        try:
+            from_snapshot = client.get(url)
+        finally:
+            del app.extensions["snapshot"]
+        assert from_snapshot.status_code == from_database.status_code
+        assert from_snapshot.get_data() == from_database.get_data()
+        assert from_snapshot.headers.get("Link") == from_database.headers.get("Link")
+        return from_database
+
+    return compare
+
+
+@pytest.fixture()
+def event_without_start(client):
+    """Adds an event that has an end date but no start date, and deletes it after the test."""
+    response = client.post("/events", json={"type": "test", "year": 2008, "country": "UK", "host": "London",
+                                            "NOC": "GBR", "end": "2008-09-17"})
+    event_id = int(response.json["message"].split("=")[1])
+    yield event_id
+    client.delete(f"/events/{event_id}")
+
+
+@pytest.mark.parametrize("url", [
+    "/events?from=2008-01-01",
+    "/events?to=2008-12-31",
+    "/events?from=2008-01-01&to=2008-12-31",
+    "/events?from=2008-09-17&to=2008-09-17&fields=id,start,end",
+])
+def test_date_filters_match_snapshot(compare_snapshot, event_without_start, url):
+    """
+    GIVEN an event with no start date
+    WHEN the events are filtered by date from the database and from the snapshot
+    THEN the responses are the same
+    """
+    compare_snapshot(url)
+
+
+def test_from_filter_includes_event_without_start(client, event_without_start):
+    """
+    GIVEN an event with an end date but no start date
+    WHEN the events are filtered with only 'from'
+    THEN the event is returned, as it ends after 'from'
+    """
+    events = client.get("/events?from=2008-01-01&fields=id&limit=1000").json
+    assert {"id": event_without_start} in events
+
+
+@pytest.mark.parametrize("url", [
+    "/regions",
+    "/regions?limit=10",
+    "/regions?limit=10&after=GBR",
+    "/regions?fields=NOC,region",
+    "/regions?fields=notes&limit=5&after=ZZZ",
+    "/regions/GBR",
+    "/regions/XXX",
+    "/events",
+    "/events?limit=5",
+    "/events?limit=5&after=10",
+    "/events?fields=year,host",
+    "/events?fields=id&limit=3&after=30",
+    "/events?type=summer&limit=3",
+    "/events?type=winter&year_from=1990&year_to=2010",
+    "/events?NOC=GBR",
+    "/events?NOC=GBR&type=summer&fields=id,year",
+    "/events?year_from=2000&limit=2&after=20",
+    "/events?from=2012-01-01&to=2012-12-31",
+    "/events/1",
+    "/events/9999",
+    "/events?limit=0",
+    "/events?limit=abc",
+    "/events?after=abc",
+    "/events?fields=nope",
+    "/events?from=not-a-date",
+    "/events?year_from=x",
+])
+def test_snapshot_matches_database(compare_snapshot, url):
+    """
+    GIVEN a list, detail, filter, fields, after or error URL
+    WHEN it is requested from the database and from the snapshot
+    THEN the status, body and Link header are the same
+    """
+    compare_snapshot(url)
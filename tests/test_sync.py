@@ -0,0 +1,90 @@
+import csv
+
+import pytest
+
+from paralympics import create_app, db
+from paralympics.database_utils import add_data, event_file, init_db, region_file, sync_data
+from paralympics.models import Event, Region
+
+
+def read_csv(csv_file):
+    with open(csv_file, encoding="utf-8-sig", newline='') as f:
+        return list(csv.reader(f))
+
+
+def write_csv(csv_file, rows):
+    with open(csv_file, "w", encoding="utf-8", newline='') as f:
+        csv.writer(f).writerows(rows)
+
+
+@pytest.fixture()
+def sync_app(app, tmp_path):
+    """App with its own database seeded from copies of the CSV files, which the tests can change.
+
+    The routes are only registered on the first app created, so that is the shared test app (the app fixture). This
+    app has no routes, but sync_data only needs the database.
+    """
+    region_csv, event_csv = tmp_path.joinpath("regions.csv"), tmp_path.joinpath("events.csv")
+    write_csv(region_csv, read_csv(region_file))
+    write_csv(event_csv, read_csv(event_file))
+    sync_app = create_app({"TESTING": True, "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path.joinpath('sync.sqlite')}",
+                      "SQLALCHEMY_ECHO": False})
+    with sync_app.app_context():
+        init_db(db)
+        add_data(db, region_csv, event_csv)
+        yield region_csv, event_csv
+
+
+def test_sync_after_seed_changes_nothing(sync_app):
+    """
+    GIVEN a database seeded from the CSV files
+    WHEN the files are synced without changes
+    THEN no rows are written
+    """
+    results = sync_data(db, *sync_app)
+    assert all(not any(counts.values()) for counts in results.values())
+
+
+def test_sync_changed_added_and_deleted_rows(sync_app):
+    """
+    GIVEN a regions file with a changed row, an added row and a removed row
+    WHEN the files are synced
+    THEN only those rows are written, and the removed region is deleted
+    """
+    region_csv, event_csv = sync_app
+    header, *rows = read_csv(region_csv)
+    noc = header.index("NOC")
+    name = header.index("region")
+    # A region with no events or medals can be deleted
+    used = set(db.session.execute(db.select(Event.NOC)).scalars()) | {"CHN"}
+    removed = next(row for row in rows if row[noc] not in used and row[noc] != "GBR")
+    rows.remove(removed)
+    gbr = next(row for row in rows if row[noc] == "GBR")
+    gbr[name] = "Great Britain"
+    added = [""] * len(header)
+    added[noc], added[name] = "ZZZ", "Test region"
+    write_csv(region_csv, [header, *rows, added])
+
+    results = sync_data(db, region_csv, event_csv)
+    assert results["region"] == {"inserted": 1, "updated": 1, "deleted": 1, "kept": 0}
+    assert results["event"] == {"inserted": 0, "updated": 0, "deleted": 0, "kept": 0}
+    assert db.session.get(Region, "GBR").region == "Great Britain"
+    assert db.session.get(Region, "ZZZ").region == "Test region"
+    assert db.session.get(Region, removed[noc]) is None
+
+
+def test_sync_keeps_regions_with_events(sync_app):
+    """
+    GIVEN a regions file without a region that has events
+    WHEN the files are synced
+    THEN the region is kept rather than leaving its events without a region
+    """
+    region_csv, event_csv = sync_app
+    header, *rows = read_csv(region_csv)
+    noc = header.index("NOC")
+    write_csv(region_csv, [header, *[row for row in rows if row[noc] != "GBR"]])
+
+    results = sync_data(db, region_csv, event_csv)
+    assert results["region"]["deleted"] == 0
+    assert results["region"]["kept"] == 1
+    assert db.session.get(Region, "GBR") is not None